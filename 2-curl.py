@@ -1,18 +1,23 @@
 from textwrap import dedent
 from agno.agent import Agent, RunResponse
-from markdownify import markdownify as md
 from common import get_url_cached, model
+from metrics import metrics
+from pages import page_markdown
+from workers import start_pool
 
+start_pool()
+
+@metrics.timed("tool.get_url")
 def get_url(url: str) -> str:
     """This function returns the webpage of the given URL.
-    It returns the full description, without any differentiation.
+    It returns the main content of the page, without the navigation, scripts, and styles.
 
     Args:
         url (str): the URL of the page
 
     Returns:
         str: the webpage as a markdown"""
-    return md(get_url_cached(url))
+    return page_markdown(get_url_cached(url))
 
 agent = Agent(
     model=model,
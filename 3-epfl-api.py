@@ -1,35 +1,18 @@
 from textwrap import dedent
-from agno.agent import Agent, RunResponse
-from common import get_url_cached, model
+from agno.agent import Agent
+from batch import run_batch
+from common import model
+from directory import find_people
+from frontier import Frontier
+from tools import get_person, get_unit, get_unit_full
+from workers import start_pool
 
-def get_person(email: str) -> str:
-    """This function returns the description of this person in the EPFL database.
-    It returns the full description, without any differentiation.
-
-    Args:
-        email (str): the email of the person
-
-    Returns:
-        str: json of the person"""
-    return get_url_cached(f"https://search-api.epfl.ch/api/ldap?q={email}&hl=en")
-
-def get_unit(name: str) -> str:
-    """This function returns the description of this unit in the EPFL database.
-    It returns the full description, without any differentiation.
-    For some of the units, the name needs to end in "-GE" to get the list of employees. 
-
-    Args:
-        name (str): the name of the unit
-
-    Returns:
-        str: json of the unit, including people"""
-
-    return get_url_cached(f"https://search-api.epfl.ch/api/unit?q={name}&hl=en")
+start_pool()
 
 agent = Agent(
     model=model,
     description="Retrieve RSEs from the EPFL database",
-    tools=[get_person, get_unit],
+    tools=[get_person, get_unit, get_unit_full, find_people],
     instructions=dedent("""\
         Your goal is to help me make a list of all Research Software Engineers (RSE) and their responsible in the 
         labs, centers, and other units of EPFL.
@@ -54,6 +37,10 @@ agent = Agent(
         To search all this information, you can use the tools I provided.
         You can use the get_person tool to get the person's page.
         You can use the get_unit tool to get the unit's page.
+        The get_unit_full tool returns all the details of the unit, only use it
+        if get_unit is missing something.
+        You can use the find_people tool to list the people with RSE-like positions
+        which are already known in a unit or a school, without querying the EPFL database.
         If a person has more than one unit, look for the unit which looks like a lab
         or a team, and use that one.
         A lot of the centers or units, which are not a lab, end in -GE for the actual
@@ -74,10 +61,21 @@ agent = Agent(
 with open("emails.txt", "r") as file:
     emails = file.readlines()
 
-for email in emails[:3]:
-    email = email.strip()
+frontier = Frontier()
+emails, skipped = frontier.plan([email.strip() for email in emails[:3]])
+for email in skipped:
+    print("1 - Already covered", email)
+
+lines_seen = set()
+for email, run in run_batch(agent, emails).items():
     print(email)
-    run: RunResponse = agent.run(email)
+    if isinstance(run, Exception):
+        print("Oups - the agent failed:", run)
+        continue
+    frontier.cover(email)
     output_parts = run.content.split("== OUTPUT ==")
     if len(output_parts) == 2:
-        print(output_parts[1].strip())
+        for line in output_parts[1].strip().splitlines():
+            if line not in lines_seen:
+                lines_seen.add(line)
+                print(line)
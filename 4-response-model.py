@@ -1,52 +1,19 @@
 from textwrap import dedent
-from agno.agent import Agent, RunResponse
-from pydantic import BaseModel, Field
-from common import get_url_cached, model
+from agno.agent import Agent
+from batch import run_batch
+from common import model
+from directory import find_people
+from output import RSEOutput
+from rse import RSEs
+from tools import get_person, get_unit, get_unit_full
+from workers import start_pool
 
-def get_person(email: str) -> str:
-    """This function returns the description of this person in the EPFL database.
-    It returns the full description, without any differentiation.
-
-    Args:
-        email (str): the email of the person
-
-    Returns:
-        str: json of the person"""
-    return get_url_cached(f"https://search-api.epfl.ch/api/ldap?q={email}&hl=en")
-
-def get_unit(name: str) -> str:
-    """This function returns the description of this unit in the EPFL database.
-    It returns the full description, without any differentiation.
-    For some of the units, the name needs to end in "-GE" to get the list of employees. 
-
-    Args:
-        name (str): the name of the unit
-
-    Returns:
-        str: json of the unit, including people"""
-    return get_url_cached(f"https://search-api.epfl.ch/api/unit?q={name}&hl=en")
-
-class RSEDescription(BaseModel):
-    organization: str = Field(..., description="Abbreviation of the rganization this unit is in - a school, college, or vice-presidency.")
-    unit_name: str = Field(..., description="Abbreviation of the unit or the lab.")
-    unit_head: str = Field(..., description="Head of the unit.")
-    person_name: str = Field(..., description="Name of the person.")
-    person_email: str = Field(..., description="Email of the person.")
-    position: str = Field(..., description="Position of the person.")
-    page_url: str = Field(..., description="URL of the person's page.")
-    
-    def csv(self) -> str:
-        """Generate a CSV representation of the RSEDescription instance."""
-        return f"{self.organization},{self.unit_name},{self.unit_head},{self.person_name},{self.position},{self.page_url}"
-
-    
-class RSEs(BaseModel):
-    rses: list[RSEDescription]
+start_pool()
 
 agent = Agent(
     model=model,
     description="Retrieve RSEs from the EPFL database",
-    tools=[get_person, get_unit],
+    tools=[get_person, get_unit, get_unit_full, find_people],
     use_json_mode=True,
     instructions=dedent("""\
         Your goal is to help me make a list of all Research Software Engineers (RSE) and their responsible in the 
@@ -71,6 +38,10 @@ agent = Agent(
         To search all this information, you can use the tools I provided.
         You can use the get_person tool to get the person's page.
         You can use the get_unit tool to get the unit's page.
+        The get_unit_full tool returns all the details of the unit, only use it
+        if get_unit is missing something.
+        You can use the find_people tool to list the people with RSE-like positions
+        which are already known in a unit or a school, without querying the EPFL database.
         If a person has more than one unit, look for the unit which looks like a lab
         or a team, and use that one.
         A lot of the centers or units, which are not a lab, end in -GE for the actual
@@ -87,10 +58,19 @@ agent = Agent(
 with open("emails.txt", "r") as file:
     emails = file.readlines()
 
-for email in emails[:3]: 
-    email = email.strip()
+output = RSEOutput()
+emails, skipped = output.frontier.plan([email.strip() for email in emails[:3]])
+for email in skipped:
+    print("1 - Already covered", email)
+
+def save(email, run):
     print(email)
-    run: RunResponse = agent.run(email)
-    if isinstance(run.content, RSEs):
+    if isinstance(run, Exception):
+        print("Oups - the agent failed:", run)
+    elif isinstance(run.content, RSEs):
         for rse in run.content.rses:
-            print(rse.csv())
+            output.write(rse)
+        output.finish(email)
+
+run_batch(agent, emails, on_result=save)
+output.close()
@@ -1,9 +1,25 @@
+import asyncio
 from textwrap import dedent
 from agno.agent import Agent, RunResponse
 from agno.tools.firecrawl import FirecrawlTools
 from pydantic import BaseModel, Field
-from markdownify import markdownify as md
-from common import get_url_cached, model
+from batch import run_batch
+from chunks import split_tokens
+from common import get_url_cached_async, model
+from pages import page_markdown_async
+from workers import start_pool
+
+start_pool()
+
+# The pipeline runs in stages, and every stage runs for all its inputs at the same
+# time: the agents through run_batch, and the fetches through the shared HTTP client,
+# limited per host by the rate limiter of common.
+# Pages are cut in chunks of at most CHUNK_TOKENS tokens, so that the time and cost
+# of a model call don't depend on the size of the page.
+
+# Number of articles of every site which are summarized, the most relevant ones,
+# so that the model calls don't grow with the size of the front pages.
+ARTICLES_PER_SITE = 5
 
 # Change the personality of the weekly-pick writer to match your interests.
 personality = dedent("""\
@@ -25,42 +41,65 @@ class NewsSummary(BaseModel):
     dt_relevance: float = Field(..., description="Relevance to digital trust and cybersecurity. 0 = none, 10 = full relevance")
     personal_relevance: float = Field(..., description="Personal relevance with regard to the interest of the querier. 0 = none, 10 = full relevance")
 
-def get_url(url: str) -> str:
-    """This function returns the webpage of the given URL.
-    It returns the full description, without any differentiation.
-
-    Args:
-        url (str): the URL of the page
+async def fetch_page(url: str) -> str | None:
+    try:
+        html = await get_url_cached_async(url)
+    except Exception as e:
+        print(f"Oups - could not fetch {url}:", e)
+        return None
+    return await page_markdown_async(html)
 
-    Returns:
-        str: the webpage as a markdown"""
-    return md(get_url_cached(url))
+async def fetch_pages(urls: list[str]) -> dict[str, str]:
+    """Fetches all pages concurrently, and returns them as markdown by URL, every page
+    being converted as soon as it arrives. The pages which could not be fetched are left out."""
+    pages = await asyncio.gather(*[fetch_page(url) for url in urls])
+    return {url: page for url, page in zip(urls, pages) if page is not None}
 
-def add_news(agent: Agent, news: NewsSummary):
-    """Adds a new summary to the list of news"""
-    print(f"Adding news {news}")
-    agent.session_state["news_list"].append(news)
+class Url(BaseModel):
+    url: str = Field(..., description="The URL to the article")
+    
+class UrlList(BaseModel):
+    url_list: list[Url]
 
 list_news = Agent(
     **AGENT_CONFIG,
-    description="Fetches the latest news and returns a summary",
-    tools=[get_url, add_news],
-    session_state={"personality": "", "news_list": []},
+    description="Lists the latest articles of a news site",
+    instructions=dedent(f"""\
+        The prompt holds the URL of a news site, followed by a part of its front page as markdown.
+        Return the full URLs of at most the {ARTICLES_PER_SITE} articles in this part which are the most related
+        to digital trust, cybersecurity, policy, attacks, or defenses, the most related first.
+        Relative links are relative to the URL of the site.
+
+        For the final reply, only send the JSON, nothing else. Don't introduce the JSON, just send the json.
+        """),
+    response_model=UrlList,
+)
+
+summarize_chunk = Agent(
+    model=model,
+    description="Summarizes a part of an article",
     instructions=dedent("""\
-        Visit the url from the prompt, and then choose the 5 most relevant articles related to digital trust to the news_list.
+        The prompt holds the URL of an article, followed by one part of the article as markdown.
+        Summarize this part in at most 100 words. Keep the facts about digital trust, cybersecurity,
+        policy, attacks, and defenses. Only reply with the summary.
+        """),
+)
+
+summarize_news = Agent(
+    **AGENT_CONFIG,
+    description="Summarizes an article",
+    session_state={"personality": ""},
+    instructions=dedent("""\
+        The prompt holds the URL of an article, followed by the article as markdown,
+        or by the summaries of the parts of a long article.
         For the dt_relevance field, only consider the relevance with regard to digital trust, cybersecurity, policy,
         attacks, as well as defenses. Consider articles which talk about defenses or how to fix
         privacy issues higher than articles which only complain about those issues.
         For the personal_relevance, consider the personality of the querier: {personality}.
         """),
+    response_model=NewsSummary,
 )
 
-class Url(BaseModel):
-    url: str = Field(..., description="The URL to the article")
-    
-class UrlList(BaseModel):
-    url_list: list[Url]
-
 order_news = Agent(
     **AGENT_CONFIG,
     description= "Returns the top 3 articles by relevance",
@@ -92,13 +131,51 @@ write_weekly = Agent(
     response_model=WeeklyPick
 )
 
-list_news.session_state={"personality": personality, "news_list": []}
-
-for url in ["www.404media.co"]:
-    list_news.run(url)
-
-order_news.session_state = list_news.session_state
-# order_news.session_state["news_list"] = []
+sites = ["www.404media.co"]
+
+# Stage 1: the front pages are fetched, and the articles are listed for every chunk.
+# Every site keeps its first ARTICLES_PER_SITE articles, in the order of its chunks.
+fronts = asyncio.run(fetch_pages(sites))
+prompts = {f"URL: {site}\n\n{chunk}": site for site, page in fronts.items() for chunk in split_tokens(page)}
+site_articles: dict[str, list[str]] = {}
+for prompt, run in run_batch(list_news, list(prompts)).items():
+    if isinstance(run, Exception) or not isinstance(run.content, UrlList):
+        print(f"Oups - could not list the articles of {prompts[prompt]}:", run if isinstance(run, Exception) else run.content)
+        continue
+    site_articles.setdefault(prompts[prompt], []).extend(article.url for article in run.content.url_list)
+articles = []
+for urls in site_articles.values():
+    articles += list(dict.fromkeys(urls))[:ARTICLES_PER_SITE]
+articles = list(dict.fromkeys(articles))
+
+# Stage 2: the articles are fetched. The chunks of the long articles are summarized
+# in parallel, and then every article is summarized from its text, or from the
+# summaries of its chunks.
+pages = asyncio.run(fetch_pages(articles))
+chunks = {url: split_tokens(page) for url, page in pages.items()}
+prompts = {f"URL: {url}\nPart {i + 1} of {len(parts)}\n\n{chunk}": url
+    for url, parts in chunks.items() if len(parts) > 1 for i, chunk in enumerate(parts)}
+notes: dict[str, list[str]] = {}
+for prompt, run in run_batch(summarize_chunk, list(prompts)).items():
+    failed = isinstance(run, Exception) or not isinstance(run.content, str)
+    notes.setdefault(prompts[prompt], []).append("(This part could not be summarized)" if failed else run.content)
+
+summarize_news.session_state = {"personality": personality}
+prompts = {}
+for url, parts in chunks.items():
+    if len(parts) == 1:
+        prompts[f"URL: {url}\n\n{parts[0]}"] = url
+    else:
+        prompts[f"URL: {url}\nSummaries of the {len(parts)} parts of the article:\n\n" + "\n\n".join(notes[url])] = url
+news_list = []
+for prompt, run in run_batch(summarize_news, list(prompts)).items():
+    if isinstance(run, Exception) or not isinstance(run.content, NewsSummary):
+        print("Oups - could not summarize", prompts[prompt])
+        continue
+    print(f"Adding news {run.content}")
+    news_list.append(run.content)
+
+order_news.session_state = {"personality": personality, "news_list": news_list}
 print("List of news articles:", order_news.session_state["news_list"])
 
 ordered: RunResponse = order_news.run("follow the instructions")
@@ -115,9 +192,12 @@ if not isinstance(ordered.content, UrlList):
 
 print("Ordered list of URLs:", ordered.content.url_list)
 write_weekly.session_state = order_news.session_state
-for article in ordered.content.url_list:
-    wp: RunResponse = write_weekly.run(article.url)
-    if isinstance(wp.content, WeeklyPick):
+# Stage 3: the weekly picks of the top articles are written in parallel.
+picks = run_batch(write_weekly, [article.url for article in ordered.content.url_list])
+for url, wp in picks.items():
+    if isinstance(wp, Exception):
+        print(f"Oups - weekly pick failed for {url}:", wp)
+    elif isinstance(wp.content, WeeklyPick):
         print(f"My take: \"{wp.content.description}\" - {wp.content.url}")
     else:
         print("Oups - weekply pick failed:", wp.content)
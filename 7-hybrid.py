@@ -0,0 +1,94 @@
+from textwrap import dedent
+from agno.agent import Agent
+from batch import run_batch
+from common import get_json_cached, model, PERSON_API, UNIT_API
+from directory import find_people
+from output import RSEOutput
+from rse import classify, RSEs
+from tools import get_person, get_unit, get_unit_full
+from workers import start_pool
+
+start_pool()
+
+# Hybrid of 4-response-model.py and 5-normal.py: the clear cases are handled
+# without any model, and only the ambiguous ones are sent to the agent.
+
+agent = Agent(
+    model=model,
+    description="Retrieve RSEs from the EPFL database",
+    tools=[get_person, get_unit, get_unit_full, find_people],
+    use_json_mode=True,
+    instructions=dedent("""\
+        Your goal is to help me make a list of all Research Software Engineers (RSE) and their responsible in the 
+        labs, centers, and other units of EPFL.
+        You will receive one email at the time of an RSE, and then have to search their
+        unit, their responsible, and eventual other RSEs in the same unit.
+        It is important to search for the other RSEs in the same unit, as I don't have
+        all the emails of all RSEs.
+        RSEs can have different names: Research software engineers, computer scientists, software engineers, etc.
+        A Doctoral Assistant is NOT an RSE, so don't include them.
+        An exception is if the Doctoral Assistant is the email given to you in the input.
+        In this case, also include the Doctoral Assistant in the output.
+
+        The organization is one of EPFL schools, colleges, or Vice Presidencies.
+        Use the abbreviation of the organization, as given in the path of the person.
+        The unit name is the name of the team or lab the person belongs to.
+        The unit head is the name of the head of the team or lab.
+        The person name is the name of the person.
+        The position is the title of the person.
+        The page url is the URL of the person's page.
+
+        To search all this information, you can use the tools I provided.
+        You can use the get_person tool to get the person's page.
+        You can use the get_unit tool to get the unit's page.
+        The get_unit_full tool returns all the details of the unit, only use it
+        if get_unit is missing something.
+        You can use the find_people tool to list the people with RSE-like positions
+        which are already known in a unit or a school, without querying the EPFL database.
+        If a person has more than one unit, look for the unit which looks like a lab
+        or a team, and use that one.
+        A lot of the centers or units, which are not a lab, end in -GE for the actual
+        unit.
+        
+        In your final response, do not reflect on your thought process, but only
+        return the final answer as JSON, as described.
+    """),
+    response_model=RSEs,
+    show_tool_calls=True,
+    debug_mode=True
+)
+
+with open("emails.txt", "r") as file:
+    emails = file.readlines()
+
+output = RSEOutput()
+emails, skipped = output.frontier.plan([email.strip() for email in emails[:3]])
+for email in skipped:
+    print("1 - Already covered", email)
+
+ambiguous = []
+for email in emails:
+    try:
+        rses, reason = classify(get_json_cached(PERSON_API.format(email)),
+            lambda name: get_json_cached(UNIT_API.format(name)))
+    except Exception as e:
+        rses, reason = None, f"Lookup failed ({e})"
+    if rses is None:
+        print(f"1 - {reason} for {email}, asking the agent")
+        ambiguous.append(email)
+    else:
+        for rse in rses:
+            output.write(rse)
+        output.finish(email)
+
+def save(email, run):
+    if isinstance(run, Exception):
+        print(f"Oups - the agent failed for {email}:", run)
+    elif isinstance(run.content, RSEs):
+        for rse in run.content.rses:
+            output.write(rse)
+        output.finish(email)
+
+run_batch(agent, ambiguous, on_result=save)
+print(f"{len(emails) - len(ambiguous)} emails without model, {len(ambiguous)} with the agent")
+output.close()
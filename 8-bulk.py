@@ -0,0 +1,77 @@
+import asyncio
+import os
+import sys
+from common import UNIT_ACRO_API, UNIT_API
+from frontier import Frontier
+from incremental import ChangeTracker
+from output import diff_rows, OUTPUT, read_rows, RSEOutput
+from rse import crawl, unit_rses, unresolved_row
+from workers import start_pool
+
+start_pool()
+
+# Bulk mode: instead of starting from the emails of emails.txt, walks all the units
+# below a root unit, like `python 8-bulk.py IC` for a whole school, and outputs
+# the RSEs of every unit once. The units which can't be resolved to a single unit
+# are listed in the output too, as an "Unresolved unit" row without a person.
+#
+# With PREVIOUS=<name> of the output of an earlier run, the run is incremental:
+# the units are requested again with conditional requests, and the differences
+# to the previous output are listed at the end, after the units whose content
+# changed. The RSEs of every unit are still found again from the unit, as a person
+# in several units is only written under the first one, which may have changed.
+# So the run uses its own frontier, and needs an OUTPUT other than PREVIOUS.
+
+# Number of requests sent concurrently to the EPFL API.
+CRAWL_CONCURRENCY = int(os.environ.get("CRAWL_CONCURRENCY", "8"))
+PREVIOUS = os.environ.get("PREVIOUS")
+
+if PREVIOUS and PREVIOUS == OUTPUT:
+    print(f"OUTPUT must differ from PREVIOUS, like OUTPUT={PREVIOUS}-new")
+    sys.exit(1)
+
+root = sys.argv[1] if len(sys.argv) > 1 else "IC"
+tracker = ChangeTracker() if PREVIOUS else None
+if tracker is None:
+    units, unresolved = asyncio.run(crawl(root, CRAWL_CONCURRENCY))
+else:
+    units, unresolved = asyncio.run(crawl(root, CRAWL_CONCURRENCY, fetch_json=tracker.fetch_json))
+
+# The frontier of other runs would skip the units seen before, which are needed
+# to compare with the previous output.
+output = RSEOutput(frontier=Frontier(None)) if PREVIOUS else RSEOutput()
+# The rows of this run, for the differences when there is no output file.
+rows = []
+for name, unit in units.items():
+    if output.frontier.visited(name):
+        print("1 - Already seen", name)
+        continue
+    for rse in unit_rses(unit):
+        if output.write(rse):
+            rows.append(rse.model_dump())
+    output.frontier.visit(name)
+for name in unresolved:
+    print("1 - No single unit for", name)
+    if not output.frontier.visited(name):
+        rse = unresolved_row(name)
+        output.write(rse)
+        rows.append(rse.model_dump())
+        output.frontier.visit(name)
+print(f"{len(units)} units below {root}")
+output.close()
+
+if tracker is not None:
+    print(f"{tracker.fetched} units requested, {tracker.not_modified} not modified, "
+        f"{len(tracker.changed)} changed")
+    for name in units:
+        if UNIT_API.format(name) in tracker.changed or UNIT_ACRO_API.format(name) in tracker.changed:
+            print("Changed unit", name)
+    previous_rows = read_rows(f"{PREVIOUS}.jsonl")
+    current_rows = read_rows(f"{output.name}.jsonl") if output.name else rows
+    added, left, changed = diff_rows(previous_rows, current_rows)
+    for row in added:
+        print("+", row["person_email"], row["unit_name"], row["position"])
+    for row in left:
+        print("-", row["person_email"], row["unit_name"], row["position"])
+    for old, new in changed:
+        print("~", new["person_email"], f"{old['unit_name']} {old['position']} -> {new['unit_name']} {new['position']}")
@@ -0,0 +1,40 @@
+import asyncio
+import os
+from agno.agent import Agent, RunResponse
+
+# Number of agent runs in flight, and seconds after which a single run is given up.
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4"))
+BATCH_TIMEOUT = float(os.environ.get("BATCH_TIMEOUT", "300"))
+
+async def run_batch_async(agent: Agent, inputs: list[str], concurrency: int = BATCH_CONCURRENCY,
+        timeout: float = BATCH_TIMEOUT, on_result=None) -> dict[str, RunResponse | Exception]:
+    """Runs the agent on all inputs, with at most `concurrency` runs at the same time.
+    Every run gets its own copy of the agent, so that the runs don't share their state.
+    `on_result(input, response)` is called as soon as a run is done, so that its
+    result is saved even if the batch is interrupted.
+
+    Returns:
+        dict[str, RunResponse | Exception]: the response for every input, in the order
+        of the inputs, or the exception if the run failed or timed out"""
+    inputs = list(dict.fromkeys(inputs))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(input: str) -> RunResponse | Exception:
+        async with semaphore:
+            try:
+                response = await asyncio.wait_for(agent.deep_copy().arun(input), timeout)
+            except asyncio.TimeoutError:
+                response = TimeoutError(f"No answer after {timeout}s")
+            except Exception as e:
+                response = e
+        if on_result is not None:
+            on_result(input, response)
+        return response
+
+    responses = await asyncio.gather(*[run(input) for input in inputs])
+    return dict(zip(inputs, responses))
+
+def run_batch(agent: Agent, inputs: list[str], concurrency: int = BATCH_CONCURRENCY,
+        timeout: float = BATCH_TIMEOUT, on_result=None) -> dict[str, RunResponse | Exception]:
+    """Synchronous version of run_batch_async."""
+    return asyncio.run(run_batch_async(agent, inputs, concurrency, timeout, on_result))
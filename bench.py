@@ -0,0 +1,224 @@
+"""Benchmarks of the fetch, cache and extraction pipeline on synthetic EPFL directories.
+
+Run it with `python bench.py --sizes 100,10000,100000 --output bench.json`.
+The synthetic persons and units follow the shape of the recorded API responses,
+and the fetches go to the local stand-in of standin.py, so no request leaves
+the machine. Every size runs in a fresh temporary directory."""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import common
+from cache_store import CacheStore
+from common import cache_to_file, get_json_cached, EPFL_SEARCH_API, PERSON_PATH, UNIT_ACRO_PATH, UNIT_PATH
+from positions import people_table, PositionClassifier
+from rate_limit import HostLimit
+from rse import crawl, extract, non_rse_positions, prefetch, rse_positions
+import standin
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Fetch benchmarks go through HTTP and only use this many records per size.
+FETCH_SAMPLE = 200
+
+def recorded_shapes() -> tuple[list[str], list[list[str]]]:
+    """Returns the positions, with their frequency, and the unit paths of the recordings."""
+    positions, paths = [], []
+    with open(os.path.join(HERE, "get_unit_cache.json")) as f:
+        for unit in json.load(f).values():
+            if isinstance(unit, dict):
+                paths.append([part["acronym"] for part in unit["path"]][:-1])
+                positions += [person["position"] for person in unit["people"] if person.get("position")]
+    return positions, paths
+
+def synthetic_directory(n_people: int, seed: int = 0) -> tuple[dict[str, list], dict[str, dict]]:
+    """Returns ldap responses by email and unit responses by acronym for `n_people` persons,
+    spread over units of about 25 people."""
+    rnd = random.Random(seed)
+    positions, paths = recorded_shapes()
+    units = {}
+    for i in range(max(1, n_people // 25)):
+        acronym = f"UNIT{i:05d}"
+        path = rnd.choice(paths) + [acronym]
+        units[acronym] = {
+            "code": 10000 + i, "acronym": acronym, "name": f"Synthetic unit {i}",
+            "unitPath": " ".join(path),
+            "path": [{"acronym": part, "name": f"{part} name"} for part in path],
+            "terminal": "1", "ghost": None, "url": None,
+            "address": [" ".join(path), "BC 000 (Bâtiment BC)", "Station 14", "1015 Lausanne"],
+            "head": None, "people": [],
+            "adminData": {"details": f"https://units.epfl.ch/#/unites/{10000 + i}"},
+        }
+    persons = {}
+    acronyms = list(units)
+    for i in range(n_people):
+        email = f"first{i}.last{i}@epfl.ch"
+        person = {"name": f"Last{i}", "firstname": f"First{i}", "email": email,
+            "sciper": str(100000 + i), "rank": 0, "profile": f"first{i}.last{i}"}
+        accreds = []
+        for order, acronym in enumerate(rnd.sample(acronyms, 2 if rnd.random() < 0.1 and len(acronyms) > 1 else 1)):
+            unit = units[acronym]
+            position = rnd.choice(positions)
+            unit["people"].append(dict(person, phoneList=["+41216930000"], officeList=["BC 000"], position=position))
+            if unit["head"] is None:
+                unit["head"] = person
+            accreds.append({"phoneList": ["+41216930000"], "officeList": ["BC 000"],
+                "path": "/".join(part["acronym"] for part in unit["path"]), "acronym": acronym,
+                "name": unit["name"], "order": order + 1, "position": position, "rank": 0, "code": unit["code"]})
+        persons[email] = [dict(person, accreds=accreds)]
+    return persons, units
+
+def synthetic_tree(units: dict[str, dict]) -> dict[str, dict]:
+    """Returns the units above the given ones up to EPFL, like schools and institutes,
+    which list their `subunits` but have no `people`, as the API returns them."""
+    parents = {}
+    for unit in units.values():
+        path = [part["acronym"] for part in unit["path"]]
+        # Some recorded paths start below EPFL, like at EHE.
+        path = path if path[0] == "EPFL" else ["EPFL"] + path
+        for depth, acronym in enumerate(path[:-1]):
+            parent = parents.setdefault(acronym, {
+                "acronym": acronym, "name": f"{acronym} name", "unitPath": " ".join(path[:depth + 1]),
+                "path": [{"acronym": part, "name": f"{part} name"} for part in path[:depth + 1]],
+                "terminal": None, "subunits": {},
+            })
+            parent["subunits"][path[depth + 1]] = {"acronym": path[depth + 1], "name": f"{path[depth + 1]} name"}
+    for parent in parents.values():
+        parent["subunits"] = list(parent["subunits"].values())
+    return parents
+
+def crawl_tree(root: str, unit_api: str, unit_acro_api: str, expected: list[str]) -> dict[str, dict]:
+    found, unresolved = asyncio.run(crawl(root, 8, unit_api, unit_acro_api=unit_acro_api))
+    missing = set(expected) - set(found)
+    if missing or unresolved:
+        raise RuntimeError(f"The crawl from {root} missed {sorted(missing)[:5]} and couldn't resolve {unresolved[:5]}")
+    return found
+
+def timed(results: list, size: int, name: str, ops: int, func):
+    start = time.perf_counter()
+    value = func()
+    seconds = time.perf_counter() - start
+    results.append({"size": size, "benchmark": name, "ops": ops, "seconds": round(seconds, 6),
+        "per_op_us": round(seconds / ops * 1e6, 3) if ops else None})
+    print(f"{size:>7} {name:<14} {ops:>7} ops {seconds:9.3f}s", file=sys.stderr)
+    return value
+
+def bench_size(size: int, latency: float) -> list[dict]:
+    results = []
+    persons, units = synthetic_directory(size)
+    emails = list(persons)
+
+    @cache_to_file
+    def bench_person(email: str) -> list:
+        return persons[email]
+
+    timed(results, size, "cache_write", size, lambda: [bench_person(email) for email in emails])
+    timed(results, size, "cache_hit", size, lambda: [bench_person(email) for email in emails])
+    store = common.cache_store("bench_person")
+    timed(results, size, "cache_load", size, lambda: CacheStore(store.path).close())
+
+    payloads = [json.dumps(unit) for unit in units.values()]
+    timed(results, size, "json_parse", len(payloads), lambda: [json.loads(payload) for payload in payloads])
+    results[-1]["bytes"] = sum(len(payload) for payload in payloads)
+
+    timed(results, size, "unit_scan", size,
+        lambda: extract(emails, persons.__getitem__, units.__getitem__, output=lambda *args: None))
+
+    table = people_table(units.values())
+    classifier = PositionClassifier(rse_positions, non_rse_positions)
+    timed(results, size, "positions", len(table["position"]), lambda: classifier.classify(table["position"]))
+
+    unit_store = CacheStore("bench_unit_cache.jsonl")
+    for acronym, unit in units.items():
+        unit_store.set(acronym, unit)
+    timed(results, size, "unit_head", len(units),
+        lambda: [unit_store.get(acronym)["head"] for acronym in units])
+    timed(results, size, "unit_head_lazy", len(units),
+        lambda: [unit_store.get_lazy(acronym)["head"] for acronym in units])
+    unit_store.close()
+
+    records = {str((EPFL_SEARCH_API + PERSON_PATH.format(email),)): persons[email] for email in emails}
+    records.update({str((EPFL_SEARCH_API + UNIT_PATH.format(acronym),)): unit for acronym, unit in units.items()})
+    sample = emails[:FETCH_SAMPLE]
+    unit_sample = list(units)[:FETCH_SAMPLE]
+    # The crawl only finds the sampled units by going through the units without
+    # people above them.
+    tree = synthetic_tree({acronym: units[acronym] for acronym in unit_sample})
+    records.update({str((EPFL_SEARCH_API + UNIT_PATH.format(acronym),)): unit for acronym, unit in tree.items()})
+    # The first sampled unit is also the prefix of another one, like LIB of LIBN,
+    # so the crawl has to request it again by its acronym.
+    prefixed = units[unit_sample[0]]
+    path = [part["acronym"] for part in prefixed["path"]]
+    records[str((EPFL_SEARCH_API + UNIT_PATH.format(prefixed["acronym"]),))] = [
+        {"acronym": acronym, "path": path[:-1] + [acronym], "name": f"{acronym} name"}
+        for acronym in (prefixed["acronym"], prefixed["acronym"] + "N")]
+    records[str((EPFL_SEARCH_API + UNIT_ACRO_PATH.format(prefixed["acronym"]),))] = prefixed
+    server = standin.serve(0, latency, records=records)
+    base = f"http://localhost:{server.server_address[1]}"
+    timed(results, size, "fetch_sync", len(unit_sample),
+        lambda: [get_json_cached(base + UNIT_PATH.format(acronym)) for acronym in unit_sample])
+    drop_cache("get_json_cached")
+    timed(results, size, "crawl_tree", len(tree) + len(unit_sample),
+        lambda: crawl_tree("EPFL", base + UNIT_PATH, base + UNIT_ACRO_PATH, unit_sample))
+    drop_cache("get_json_cached")
+    persons_fetched, units_fetched = timed(results, size, "crawl", len(sample),
+        lambda: asyncio.run(prefetch(sample, 8, base + PERSON_PATH, base + UNIT_PATH)))
+    timed(results, size, "crawl_extract", len(sample),
+        lambda: extract(sample, persons_fetched.__getitem__, units_fetched.__getitem__, output=lambda *args: None))
+    server.shutdown()
+    return results
+
+def drop_cache(name: str):
+    """Closes and removes the cache of the given function, so the next calls miss."""
+    store = common.cache_stores.pop(name, None)
+    if store is not None:
+        store.close()
+        os.remove(store.path)
+
+def close_stores():
+    for store in common.cache_stores.values():
+        store.close()
+    common.cache_stores.clear()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100,10000,100000", help="comma separated number of persons")
+    parser.add_argument("--latency", type=float, default=0.0, help="latency of the stand-in API in seconds")
+    parser.add_argument("--output", help="JSON file for the results, instead of stdout")
+    args = parser.parse_args()
+
+    common.rate_limiter.configure("localhost", HostLimit(rate=1e6, burst=1_000_000, concurrency=64))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=HERE,
+            capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    report = {
+        "meta": {"commit": commit, "python": platform.python_version(), "machine": platform.machine(),
+            "cpus": os.cpu_count(), "latency": args.latency, "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": [],
+    }
+    cwd = os.getcwd()
+    for size in [int(size) for size in args.sizes.split(",")]:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                report["results"] += bench_size(size, args.latency)
+            finally:
+                close_stores()
+                os.chdir(cwd)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from lazy_json import encode, LazyObject
+
+# Compaction kicks in once the dead records are larger than the live ones,
+# but never for files smaller than this.
+COMPACT_MIN_BYTES = 1 << 20
+
+@dataclass
+class CachePolicy:
+    """Freshness and size bounds of a cache store.
+
+    Entries older than `ttl` seconds are stale. Once the store holds more than
+    `max_entries` entries or `max_bytes` bytes of live records, the least recently
+    used entries are evicted. With `stale_while_revalidate`, a stale entry is still
+    served while it is refreshed in the background."""
+    ttl: float | None = None
+    max_entries: int | None = None
+    max_bytes: int | None = None
+    stale_while_revalidate: bool = False
+
+class CacheStore:
+    """Append-only on-disk cache with an in-memory index.
+
+    Each record is a single line `<json header>\\t<json value>\\n`, where the header
+    holds the key, the time of the write, and for dicts the offsets of their members
+    used by get_lazy. The file is read once when the store is opened, and the
+    index then maps every key to the offset and length of its value. A lookup reads and parses only that record, and a new entry is appended
+    to the end of the file, so both stay flat as the cache grows.
+    Overwritten entries stay in the file until it is compacted.
+    The index is kept in least recently used order for the eviction of the policy."""
+
+    def __init__(self, path: str, policy: CachePolicy | None = None):
+        self.path = path
+        self.policy = policy or CachePolicy()
+        # Called with the key and value of every new entry.
+        self.listeners = []
+        self.lock = threading.RLock()
+        # key -> (value offset, value length, write time, record size)
+        self.index: dict[str, tuple[int, int, float, int]] = {}
+        self.live_bytes = 0
+        self.dead_bytes = 0
+        self.file = open(path, "a+b")
+        self._load()
+
+    def _load(self):
+        self.file.seek(0)
+        offset = 0
+        for line in self.file:
+            if not line.endswith(b"\n"):
+                # Partial record from an interrupted write.
+                self.file.truncate(offset)
+                break
+            tab = line.index(b"\t")
+            header = json.loads(line[:tab])
+            self._index(header, offset + tab + 1, len(line) - tab - 2, len(line))
+            offset += len(line)
+
+    def _index(self, header: dict, offset: int, length: int, size: int):
+        old = self.index.pop(header["k"], None)
+        if old is not None:
+            self.live_bytes -= old[3]
+            self.dead_bytes += old[3]
+        if header.get("d"):
+            self.dead_bytes += size
+        else:
+            self.index[header["k"]] = (offset, length, header["t"], size)
+            self.live_bytes += size
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def keys(self) -> list[str]:
+        with self.lock:
+            return list(self.index)
+
+    def is_fresh(self, key: str) -> bool:
+        entry = self.index.get(key)
+        if entry is None:
+            return False
+        return self.policy.ttl is None or time.time() - entry[2] < self.policy.ttl
+
+    def _touch(self, key: str) -> tuple[int, int, float, int] | None:
+        entry = self.index.pop(key, None)
+        if entry is not None:
+            self.index[key] = entry
+        return entry
+
+    def get(self, key: str, default=None):
+        with self.lock:
+            entry = self._touch(key)
+            if entry is None:
+                return default
+            self.file.seek(entry[0])
+            return json.loads(self.file.read(entry[1]))
+
+    def get_lazy(self, key: str, default=None):
+        """Same as get, but a dict is returned as a LazyObject, which only parses
+        the members which are read."""
+        with self.lock:
+            entry = self._touch(key)
+            if entry is None:
+                return default
+            offset, length, _, size = entry
+            self.file.seek(offset + length + 1 - size)
+            record = self.file.read(size - 1)
+        tab = record.index(b"\t")
+        spans = json.loads(record[:tab]).get("s")
+        if spans is not None:
+            return LazyObject(record[tab + 1:], spans)
+        value = json.loads(record[tab + 1:])
+        data, spans = encode(value)
+        if spans is not None:
+            # Written before the offsets were kept, they are added for the next reads.
+            with self.lock:
+                if self.index.get(key) == entry:
+                    self._append({"k": key, "t": entry[2], "s": spans}, data)
+        return value
+
+    def set(self, key: str, value, timestamp: float | None = None):
+        header = {"k": key, "t": time.time() if timestamp is None else timestamp}
+        data, spans = encode(value)
+        if spans is not None:
+            header["s"] = spans
+        with self.lock:
+            self._append(header, data)
+            self._evict()
+        for listener in self.listeners:
+            listener(key, value)
+
+    def _evict(self):
+        max_entries = self.policy.max_entries
+        max_bytes = self.policy.max_bytes
+        while len(self.index) > 1 and (
+                (max_entries is not None and len(self.index) > max_entries) or
+                (max_bytes is not None and self.live_bytes > max_bytes)):
+            self.delete(next(iter(self.index)))
+
+    def delete(self, key: str):
+        with self.lock:
+            if key in self.index:
+                self._append({"k": key, "d": True}, b"null")
+
+    def _append(self, header: dict, value: bytes):
+        line = json.dumps(header).encode() + b"\t" + value + b"\n"
+        with self.lock:
+            self.file.seek(0, os.SEEK_END)
+            offset = self.file.tell()
+            self.file.write(line)
+            self.file.flush()
+            self._index(header, offset + len(line) - len(value) - 1, len(value), len(line))
+            if self.dead_bytes > max(self.live_bytes, COMPACT_MIN_BYTES):
+                self.compact()
+
+    def compact(self):
+        """Rewrite the file with only the live records."""
+        with self.lock:
+            tmp = f"{self.path}.tmp"
+            index = {}
+            with open(tmp, "wb") as out:
+                for key, (offset, length, timestamp, size) in self.index.items():
+                    self.file.seek(offset + length + 1 - size)
+                    index[key] = (out.tell() + size - length - 1, length, timestamp, size)
+                    out.write(self.file.read(size))
+            self.file.close()
+            os.replace(tmp, self.path)
+            self.file = open(self.path, "a+b")
+            self.index = index
+            self.live_bytes = sum(entry[3] for entry in index.values())
+            self.dead_bytes = 0
+
+    def migrate(self, json_file: str, key_fn=None):
+        """Imports the entries of a legacy whole-file JSON cache.
+
+        Args:
+            json_file (str): path of the legacy `<func>_cache.json` file
+            key_fn: optional function mapping a legacy key to the key in this store"""
+        with open(json_file, "r") as f:
+            legacy = json.load(f)
+        timestamp = os.path.getmtime(json_file)
+        for key, value in legacy.items():
+            if key_fn is not None:
+                key = key_fn(key)
+            if key not in self.index:
+                self.set(key, value, timestamp)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
@@ -0,0 +1,60 @@
+import functools
+import os
+import tiktoken
+
+# Splitting of long pages in chunks which fit in the context of one model call.
+#
+# The tokens are counted with the cl100k_base encoding of tiktoken. Its first use
+# downloads the encoding, so without network the count falls back to the usual
+# estimate of 4 characters per token, which is close enough for a budget.
+
+# Number of tokens of a chunk of page given to a single model call.
+CHUNK_TOKENS = int(os.environ.get("CHUNK_TOKENS", "4000"))
+CHARS_PER_TOKEN = 4
+
+@functools.cache
+def encoding() -> tiktoken.Encoding | None:
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print("Counting tokens by characters, tiktoken could not load its encoding:", type(e).__name__)
+        return None
+
+def count_tokens(text: str) -> int:
+    enc = encoding()
+    if enc is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(enc.encode(text, disallowed_special=()))
+
+def split_long(text: str, budget: int) -> list[str]:
+    """Cuts a single paragraph which is longer than the budget."""
+    enc = encoding()
+    if enc is None:
+        size = budget * CHARS_PER_TOKEN
+        return [text[i:i + size] for i in range(0, len(text), size)]
+    tokens = enc.encode(text, disallowed_special=())
+    return [enc.decode(tokens[i:i + budget]) for i in range(0, len(tokens), budget)]
+
+def split_tokens(text: str, budget: int = CHUNK_TOKENS) -> list[str]:
+    """Splits the markdown in chunks of at most `budget` tokens. The chunks end on
+    paragraph boundaries, except for paragraphs longer than the budget.
+
+    Returns:
+        list[str]: the chunks, a single one if the text fits in the budget"""
+    if count_tokens(text) <= budget:
+        return [text]
+    chunks = []
+    current, size = [], 0
+    for paragraph in text.split("\n\n"):
+        tokens = count_tokens(paragraph)
+        if current and size + tokens > budget:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+        if tokens > budget:
+            chunks += split_long(paragraph, budget)
+        else:
+            current.append(paragraph)
+            size += tokens + 1
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
@@ -1,74 +1,360 @@
 from dotenv import load_dotenv
-from agno.models.lmstudio import LMStudio
-from agno.models.openai import OpenAIChat
-from agno.models.openai.like import OpenAILike
-from agno.models.anthropic import Claude
 import os
 import sys
 import signal
-import json
+import ast
+import asyncio
+import functools
+import importlib.util
+import inspect
+import random
+import threading
+import time
+import weakref
 import httpx
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+from cache_store import CachePolicy, CacheStore
+from metrics import InstrumentedModel, metrics, with_mixin
+from rate_limit import HostLimit, RateLimiter
+from workers import load_json, load_json_async
 
 load_dotenv()
-if os.environ.get("ANTHROPIC_API_KEY", "0") != "0":
-    print("Using Anthropic Claude")
-    model=Claude(id="claude-3-7-sonnet-latest")
-elif os.environ.get("OPENAI_API_KEY", "0") != "0":
-    print("Using OpenAI GPT-4.1")
-    model=OpenAIChat(id="gpt-4.1")
-elif os.environ.get("OPENAI_LIKE", "0") != "0":
-    print("Using OpenAI-like for AnythingLLM")
-    model=OpenAILike(api_key=os.getenv("OPENAI_LIKE"),
-		id="c4dt",
-		base_url="http://localhost:3001/api/v1/openai")
-else:
-    print("Using LMStudio")
-    model=LMStudio()
+
+@functools.cache
+def get_model():
+    """Returns the model of the provider configured in the environment.
+    It is created on first use, and only then the SDK of the provider is imported,
+    so that the fetch and cache utilities load without any LLM SDK."""
+    if os.environ.get("ANTHROPIC_API_KEY", "0") != "0":
+        from agno.models.anthropic import Claude
+        print("Using Anthropic Claude")
+        model=Claude(id="claude-3-7-sonnet-latest")
+    elif os.environ.get("OPENAI_API_KEY", "0") != "0":
+        from agno.models.openai import OpenAIChat
+        print("Using OpenAI GPT-4.1")
+        model=OpenAIChat(id="gpt-4.1")
+    elif os.environ.get("OPENAI_LIKE", "0") != "0":
+        from agno.models.openai.like import OpenAILike
+        print("Using OpenAI-like for AnythingLLM")
+        model=OpenAILike(api_key=os.getenv("OPENAI_LIKE"),
+            id="c4dt",
+            base_url="http://localhost:3001/api/v1/openai")
+    else:
+        from agno.models.lmstudio import LMStudio
+        print("Using LMStudio")
+        model=LMStudio()
+    model = with_mixin(model, InstrumentedModel)
+
+    # With LLM_CACHE=1, the responses of the model are cached in llm_response_cache.jsonl,
+    # see llm_cache.py.
+    if os.environ.get("LLM_CACHE", "0") != "0":
+        from llm_cache import cache_responses
+        model = cache_responses(model)
+    return model
+
+def __getattr__(name: str):
+    # `from common import model` creates the model on first use.
+    if name == "model":
+        return get_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Called on Ctrl-C before exiting, like the close of the outputs of output.py.
+exit_callbacks = []
+
+def on_exit(callback):
+    exit_callbacks.append(callback)
+    return callback
 
 def signal_handler(sig, frame):
+    for callback in reversed(exit_callbacks):
+        callback()
     sys.exit(0)
 
 signal.signal(signal.SIGINT, signal_handler)
 
-def cache_to_file(func):
-    """Decorator to cache function results to a local file."""
+# EPFL search API, to be formatted with the email of a person or the name of a unit.
+# EPFL_API points the fetches to another server, like the stand-in of standin.py.
+EPFL_SEARCH_API = "https://search-api.epfl.ch"
+EPFL_API = os.environ.get("EPFL_API", EPFL_SEARCH_API).rstrip("/")
+PERSON_PATH = "/api/ldap?q={}&hl=en"
+UNIT_PATH = "/api/unit?q={}&hl=en"
+# The unit with exactly this acronym, when the search by `q` returns the units
+# whose acronym starts with it.
+UNIT_ACRO_PATH = "/api/unit?acro={}&hl=en"
+PERSON_API = EPFL_API + PERSON_PATH
+UNIT_API = EPFL_API + UNIT_PATH
+UNIT_ACRO_API = EPFL_API + UNIT_ACRO_PATH
+
+# With REPLAY set, every fetch is served from the responses recorded in the caches,
+# and a URL which was never recorded fails instead of going to the network.
+REPLAY = os.environ.get("REPLAY", "0") != "0"
+
+# Whole-file JSON caches written by earlier versions, which are imported once
+# into the store of the given function when its cache file is first created.
+LEGACY_CACHES = {
+    "get_json_cached": [
+        ("get_person_cache.json", EPFL_SEARCH_API + PERSON_PATH),
+        ("get_unit_cache.json", EPFL_SEARCH_API + UNIT_PATH),
+    ],
+}
+
+# Time-to-live in seconds of the fetched pages, which never expire if not set.
+# Stale pages are served while being refreshed in the background.
+CACHE_TTL = float(os.environ.get("CACHE_TTL", "0")) or None
+
+# Cache policy per function name. The decorator registers the policy it is given,
+# which can be overridden here before the first call of the function.
+cache_policies: dict[str, CachePolicy] = {}
+cache_stores: dict[str, CacheStore] = {}
+cache_stores_lock = threading.Lock()
+
+# Background refreshes of stale entries for the stale-while-revalidate policy.
+revalidate_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="revalidate")
+revalidating: set[tuple[str, str]] = set()
+missing = object()
+
+def cache_store(name: str) -> CacheStore:
+    """Returns the cache store of the given function, opening it on first use."""
+    with cache_stores_lock:
+        if name not in cache_stores:
+            cache_file = f"{name}_cache.jsonl"
+            is_new = not os.path.exists(cache_file)
+            store = CacheStore(cache_file, cache_policies.get(name))
+            if is_new:
+                if os.path.exists(f"{name}_cache.json"):
+                    store.migrate(f"{name}_cache.json")
+                for legacy_file, url in LEGACY_CACHES.get(name, []):
+                    if os.path.exists(legacy_file):
+                        store.migrate(legacy_file,
+                            lambda key, url=url: str((url.format(*ast.literal_eval(key)),)))
+            cache_stores[name] = store
+        return cache_stores[name]
+
+def revalidate(cache: CacheStore, name: str, key: str, func, args):
+    with cache_stores_lock:
+        if (name, key) in revalidating:
+            return
+        revalidating.add((name, key))
+
+    def refresh():
+        try:
+            cache.set(key, func(*args))
+        except Exception as e:
+            print(f"Couldn't refresh {name}{key}: {e}")
+        finally:
+            with cache_stores_lock:
+                revalidating.discard((name, key))
+
+    revalidate_pool.submit(refresh)
+
+def cache_to_file(func=None, name: str | None = None, lazy: bool = False, **policy):
+    """Decorator to cache function results to a local file.
+    Can be used bare, or with the fields of a CachePolicy, like
+    `@cache_to_file(ttl=86400, max_entries=10000)`.
+    Coroutine functions are cached too, and `name` lets them share the file
+    of the synchronous function fetching the same data.
+    With `lazy`, cached dicts are returned as LazyObjects, see CacheStore.get_lazy."""
+    if func is None:
+        return lambda func: cache_to_file(func, name, lazy, **policy)
+    name = name or func.__name__
+    cache_policies.setdefault(name, CachePolicy(**policy))
+
+    def lookup(key: str, args):
+        cache = cache_store(name)
+        fresh = cache.is_fresh(key)
+        with metrics.span(f"cache.{name}.get"):
+            result = cache.get_lazy(key, missing) if lazy else cache.get(key, missing)
+        if result is missing:
+            metrics.count(f"cache.{name}.misses")
+        elif fresh:
+            metrics.count(f"cache.{name}.hits")
+        else:
+            if not cache.policy.stale_while_revalidate:
+                metrics.count(f"cache.{name}.misses")
+                return missing
+            metrics.count(f"cache.{name}.hits")
+            metrics.count(f"cache.{name}.stale")
+            refresh = func
+            if inspect.iscoroutinefunction(func):
+                refresh = lambda *args: asyncio.run(func(*args))
+            revalidate(cache, name, key, refresh, args)
+        return result
     
     def wrapper(*args):
-        cache_file = f"{func.__name__}_cache.json"
-        # Load cache from file if it exists
-        if os.path.exists(cache_file):
-            with open(cache_file, "r") as f:
-                cache = json.load(f)
-        else:
-            cache = {}
-        
         # Check if result is already cached
         key = str(args)
-        if key in cache:
-            return cache[key]
+        result = lookup(key, args)
+        if result is not missing:
+            return result
         
         # Call the function and cache the result
         result = func(*args)
-        cache[key] = result
-        with open(cache_file, "w") as f:
-            json.dump(cache, f)
+        cache_store(name).set(key, result)
+        return result
+
+    async def async_wrapper(*args):
+        key = str(args)
+        result = lookup(key, args)
+        if result is not missing:
+            return result
+        result = await func(*args)
+        cache_store(name).set(key, result)
         return result
     
-    return wrapper
+    return async_wrapper if inspect.iscoroutinefunction(func) else wrapper
 
-def get_response_cached(url: str) -> httpx.Response:
+def full_url(url: str) -> str:
     if not (url.startswith("https://") or url.startswith("http://")):
         url = f"https://{url}"
-    
-    response = httpx.get(url)
-    response.raise_for_status()
+    return url
+
+# Connection settings of the shared HTTP clients. HTTP/2 needs the optional
+# h2 package, else the clients fall back to HTTP/1.1 with keep-alive.
+HTTP_TIMEOUT = httpx.Timeout(float(os.environ.get("HTTP_TIMEOUT", "10")), connect=5)
+HTTP_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=30)
+HTTP2 = importlib.util.find_spec("h2") is not None
+# Failed requests are retried with an exponential backoff starting at HTTP_BACKOFF
+# seconds, unless the server asks for a specific delay with Retry-After.
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "4"))
+HTTP_BACKOFF = 0.5
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Client-side rate limit shared by all fetches, so that concurrent crawls and agents
+# stay below the throttling of the EPFL API. Other hosts get the same defaults.
+RATE_LIMIT = HostLimit(
+    rate=float(os.environ.get("RATE_LIMIT", "10")),
+    burst=int(os.environ.get("RATE_BURST", "20")),
+    concurrency=int(os.environ.get("HOST_CONCURRENCY", "8")))
+rate_limiter = RateLimiter(RATE_LIMIT)
+metrics.sources["rate_limiter"] = rate_limiter.metrics
+
+http_client: httpx.Client | None = None
+http_client_lock = threading.Lock()
+# An async client is bound to the event loop it was first used in.
+async_http_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+def get_http_client() -> httpx.Client:
+    """Returns the pooled client shared by all synchronous fetches."""
+    global http_client
+    with http_client_lock:
+        if http_client is None:
+            http_client = httpx.Client(http2=HTTP2, timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+        return http_client
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Returns the pooled client shared by all fetches in the running event loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in async_http_clients:
+        async_http_clients[loop] = httpx.AsyncClient(http2=HTTP2, timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+    return async_http_clients[loop]
+
+def retry_delay(attempt: int, response: httpx.Response | None) -> float:
+    """Returns the seconds to wait before retrying a failed request."""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            pass
+    return HTTP_BACKOFF * 2 ** attempt * random.uniform(0.5, 1)
+
+class ReplayMiss(LookupError):
+    """Raised in replay mode for a URL without a recorded response."""
+
+def recorded_response(url: str) -> httpx.Response:
+    """Returns the response recorded for this URL by get_url_cached or get_json_cached.
+    Recordings of the EPFL API are also found if EPFL_API points elsewhere."""
+    urls = {url, full_url(url)}
+    for u in list(urls):
+        if u.startswith(EPFL_API):
+            urls.add(EPFL_SEARCH_API + u[len(EPFL_API):])
+    request = httpx.Request("GET", full_url(url))
+    for u in urls:
+        key = str((u,))
+        text = cache_store("get_url_cached").get(key, missing)
+        if text is not missing:
+            return httpx.Response(200, text=text, request=request)
+        data = cache_store("get_json_cached").get(key, missing)
+        if data is not missing:
+            return httpx.Response(200, json=data, request=request)
+    raise ReplayMiss(f"No recorded response for {url}")
+
+def get_response_cached(url: str, headers: dict | None = None) -> httpx.Response:
+    if REPLAY:
+        return recorded_response(url)
+    client = get_http_client()
+    url = full_url(url)
+    host = httpx.URL(url).host
+    for attempt in range(HTTP_RETRIES + 1):
+        response = None
+        try:
+            with rate_limiter.limit(host):
+                with metrics.span("fetch", url=url, attempt=attempt):
+                    response = client.get(url, headers=headers)
+            if response.status_code not in RETRY_STATUS or attempt == HTTP_RETRIES:
+                break
+        except httpx.TransportError:
+            if attempt == HTTP_RETRIES:
+                raise
+        metrics.count("fetch.retries")
+        time.sleep(retry_delay(attempt, response))
+    metrics.count("fetch.requests")
+    metrics.count("fetch.bytes", len(response.content))
+    # A 304 answers the conditional headers, and is handled by the caller.
+    if response.status_code != 304:
+        response.raise_for_status()
+    return response
+
+async def get_response_cached_async(url: str, headers: dict | None = None) -> httpx.Response:
+    if REPLAY:
+        return recorded_response(url)
+    client = get_async_http_client()
+    url = full_url(url)
+    host = httpx.URL(url).host
+    for attempt in range(HTTP_RETRIES + 1):
+        response = None
+        try:
+            async with rate_limiter.limit_async(host):
+                with metrics.span("fetch", url=url, attempt=attempt):
+                    response = await client.get(url, headers=headers)
+            if response.status_code not in RETRY_STATUS or attempt == HTTP_RETRIES:
+                break
+        except httpx.TransportError:
+            if attempt == HTTP_RETRIES:
+                raise
+        metrics.count("fetch.retries")
+        await asyncio.sleep(retry_delay(attempt, response))
+    metrics.count("fetch.requests")
+    metrics.count("fetch.bytes", len(response.content))
+    # A 304 answers the conditional headers, and is handled by the caller.
+    if response.status_code != 304:
+        response.raise_for_status()
     return response
     
-@cache_to_file
+@cache_to_file(ttl=CACHE_TTL, stale_while_revalidate=True)
 def get_url_cached(url: str) -> str:
     return get_response_cached(url).text
 
-@cache_to_file
+@cache_to_file(ttl=CACHE_TTL, stale_while_revalidate=True)
 def get_json_cached(url: str) -> str:
-    return get_response_cached(url).json()
+    return load_json(get_response_cached(url).content)
+
+# Same as get_json_cached, for the extractors which only read a few fields of
+# the large unit responses.
+@cache_to_file(name="get_json_cached", lazy=True, ttl=CACHE_TTL, stale_while_revalidate=True)
+def get_json_lazy(url: str) -> str:
+    return load_json(get_response_cached(url).content)
+
+@cache_to_file(name="get_url_cached", ttl=CACHE_TTL, stale_while_revalidate=True)
+async def get_url_cached_async(url: str) -> str:
+    return (await get_response_cached_async(url)).text
 
+@cache_to_file(name="get_json_cached", ttl=CACHE_TTL, stale_while_revalidate=True)
+async def get_json_cached_async(url: str) -> str:
+    return await load_json_async((await get_response_cached_async(url)).content)
@@ -0,0 +1,49 @@
+import copy
+import hashlib
+import json
+import marshal
+from bs4 import BeautifulSoup
+from markdownify import MarkdownConverter
+
+# Conversions which also run in the processes of the pool of workers.py: the
+# decoding of the JSON responses, and the conversion of the pages to markdown.
+# The workers import this module to find the functions they are sent, so it
+# doesn't import common, which loads the environment and sets the signal handlers.
+
+BOILERPLATE = ["script", "style", "noscript", "template", "svg", "canvas", "iframe",
+    "nav", "dialog"]
+# Only removed outside of the main content and of the articles.
+PAGE_CHROME = ["header", "footer", "aside", "form", "button"]
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def main_content(soup: BeautifulSoup):
+    """Returns the main content of the page, without the boilerplate."""
+    for tag in soup(BOILERPLATE):
+        tag.decompose()
+    main = soup.find("main") or soup.find(attrs={"role": "main"})
+    if main is None:
+        articles = soup.find_all("article")
+        if len(articles) == 1:
+            return articles[0]
+        # Without a main content, the headers of the page are in the body.
+        body = soup.body or soup
+        main = copy.copy(body)
+        for tag in main(PAGE_CHROME):
+            if tag.find_parent("article") is None:
+                tag.decompose()
+        # Some pages are laid out in a single form, which would leave nothing.
+        if not main.get_text(strip=True):
+            return body
+    return main
+
+def convert_page(html: str) -> bytes:
+    """Converts the page in a worker, and returns the marshalled hash of its main
+    content and its markdown."""
+    main = main_content(BeautifulSoup(html, "lxml"))
+    return marshal.dumps((content_hash(str(main)), MarkdownConverter().convert_soup(main).strip()))
+
+def decode_json(data: bytes) -> bytes:
+    """Decodes the JSON in a worker, and returns it marshalled."""
+    return marshal.dumps(json.loads(data))
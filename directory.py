@@ -0,0 +1,173 @@
+import ast
+import json
+import sys
+import threading
+from common import cache_store, PERSON_API, UNIT_API
+from metrics import metrics
+
+class Person:
+    """A person of the directory, with the position held in each of their units."""
+    __slots__ = ("sciper", "email", "name", "firstname", "positions")
+
+    def __init__(self, sciper: str, email: str | None, name: str, firstname: str):
+        self.sciper = sciper
+        self.email = email
+        self.name = name
+        self.firstname = firstname
+        self.positions: dict[str, str] = {}
+
+    def __repr__(self) -> str:
+        return f"Person({self.email}, {self.positions})"
+
+class Unit:
+    """A unit of the directory. `path` is the path of acronyms, like EPFL/IC/IINFCOM/CLAIRE."""
+    __slots__ = ("acronym", "name", "path", "head", "people")
+
+    def __init__(self, acronym: str, name: str | None, path: str):
+        self.acronym = acronym
+        self.name = name
+        self.path = path
+        self.head: Person | None = None
+        self.people: list[Person] = []
+
+    def __repr__(self) -> str:
+        return f"Unit({self.path}, {len(self.people)} people)"
+
+def intern(value: str | None) -> str | None:
+    return sys.intern(value) if value is not None else None
+
+class Directory:
+    """In-memory index of the persons and units fetched from the EPFL API.
+
+    The index is built from the records in the get_json_cached cache, and follows
+    the new records written to it. All lookups are local, without any request.
+    The new records are added by the thread which wrote them, so the updates and
+    the lookups hold the lock."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.by_email: dict[str, Person] = {}
+        self.by_sciper: dict[str, Person] = {}
+        self.units: dict[str, Unit] = {}
+        # position -> (sciper, unit acronym) -> person
+        self.by_position: dict[str, dict[tuple[str, str], Person]] = {}
+        # path prefix -> acronyms of the units below it
+        self.by_prefix: dict[str, set[str]] = {}
+
+    @classmethod
+    def from_cache(cls) -> "Directory":
+        """Builds the directory from the cached API responses, and keeps it up to date
+        with the responses fetched afterwards."""
+        directory = cls()
+        store = cache_store("get_json_cached")
+        for key in store.keys():
+            directory.add_response(key, store.get(key))
+        store.listeners.append(directory.add_response)
+        return directory
+
+    def add_response(self, key: str, value):
+        """Adds a response of get_json_cached, given with its cache key."""
+        url = ast.literal_eval(key)[0]
+        with self.lock:
+            if url.startswith(PERSON_API.split("{}")[0]):
+                for result in value:
+                    self.add_person(result)
+            elif url.startswith(UNIT_API.split("?")[0] + "?"):
+                for result in value if isinstance(value, list) else [value]:
+                    self.add_unit(result)
+
+    def person(self, record: dict) -> Person:
+        sciper = record["sciper"]
+        if sciper not in self.by_sciper:
+            self.by_sciper[sciper] = Person(sciper, intern(record.get("email")),
+                record.get("name"), record.get("firstname"))
+        person = self.by_sciper[sciper]
+        if record.get("email"):
+            person.email = intern(record["email"])
+            self.by_email[person.email] = person
+        return person
+
+    def unit(self, acronym: str, name: str | None, path: str) -> Unit:
+        if acronym not in self.units:
+            self.units[acronym] = Unit(intern(acronym), name, intern(path))
+            parts = path.split("/")
+            for i in range(1, len(parts) + 1):
+                self.by_prefix.setdefault(intern("/".join(parts[:i])), set()).add(self.units[acronym].acronym)
+        return self.units[acronym]
+
+    def set_position(self, person: Person, acronym: str, position: str | None):
+        old = person.positions.pop(acronym, None)
+        if old is not None:
+            self.by_position[old].pop((person.sciper, acronym), None)
+        if position is not None:
+            position = intern(position)
+            person.positions[acronym] = position
+            self.by_position.setdefault(position, {})[(person.sciper, acronym)] = person
+
+    def add_person(self, record: dict):
+        """Adds a person as returned by the ldap API, with all their accreditations."""
+        person = self.person(record)
+        for accred in record.get("accreds", []):
+            self.unit(accred["acronym"], accred.get("name"), accred["path"])
+            self.set_position(person, accred["acronym"], accred.get("position"))
+
+    def add_unit(self, record: dict):
+        """Adds a unit as returned by the unit API. Search results listing several units
+        only add the units, without their people."""
+        path = record["path"]
+        if path and isinstance(path[0], dict):
+            path = [part["acronym"] for part in path]
+        unit = self.unit(record["acronym"], record.get("name"), "/".join(path))
+        if record.get("head") and record["head"].get("sciper"):
+            unit.head = self.person(record["head"])
+        if "people" in record:
+            for person in unit.people:
+                self.set_position(person, unit.acronym, None)
+            unit.people = []
+            for entry in record["people"]:
+                person = self.person(entry)
+                unit.people.append(person)
+                self.set_position(person, unit.acronym, entry.get("position"))
+
+    def units_under(self, prefix: str) -> list[Unit]:
+        """Returns the units whose path starts with the given path, like EPFL/IC."""
+        with self.lock:
+            return [self.units[acronym] for acronym in self.by_prefix.get(prefix.strip("/"), ())]
+
+    def people_with(self, positions: set[str], prefix: str = "EPFL") -> list[tuple[Person, Unit, str]]:
+        """Returns the people holding one of the positions in a unit under the given path,
+        with the position they held at the time of the call."""
+        found = []
+        with self.lock:
+            acronyms = self.by_prefix.get(prefix.strip("/"), set())
+            for position in positions:
+                for (_, acronym), person in self.by_position.get(position, {}).items():
+                    if acronym in acronyms:
+                        found.append((person, self.units[acronym], position))
+        return found
+
+local_directory: Directory | None = None
+# The tools run in several threads, which must share a single directory.
+local_directory_lock = threading.Lock()
+
+@metrics.timed("tool.find_people")
+def find_people(path: str, positions: list[str]) -> str:
+    """This function searches the people already known locally, without querying the EPFL database.
+    It returns the people holding one of the given positions in the units under the given path.
+
+    Args:
+        path (str): the path of the units, like EPFL/IC or EPFL/IC/IINFCOM/CLAIRE
+        positions (list[str]): the positions to look for, like Research Software Engineer
+
+    Returns:
+        str: json list of the people, with their email, position, and unit"""
+    global local_directory
+    with local_directory_lock:
+        if local_directory is None:
+            local_directory = Directory.from_cache()
+    return json.dumps([{
+        "name": f"{person.firstname} {person.name}",
+        "email": person.email,
+        "position": position,
+        "unit": unit.path,
+    } for person, unit, position in local_directory.people_with(set(positions), path)])
@@ -0,0 +1,107 @@
+import os
+from cache_store import CacheStore
+from common import get_json_cached, PERSON_API
+
+# Name of the frontier kept across runs, like `rse` for rse_frontier.jsonl.
+# Without it, every run starts with an empty frontier.
+FRONTIER = os.environ.get("FRONTIER")
+
+def person_units(results: list) -> list[str] | None:
+    """Returns the units of a person as returned by the ldap API, without the
+    student units, or None if the email didn't match exactly one person."""
+    if len(results) != 1:
+        return None
+    units = []
+    for accred in results[0]["accreds"]:
+        path = accred["path"].split("/")
+        if path[1] != "ETU":
+            units.append(path[-1])
+    return units
+
+def lookup_units(email: str) -> list[str] | None:
+    """Returns the units of the person with this email, or None if the lookup failed."""
+    try:
+        return person_units(get_json_cached(PERSON_API.format(email)))
+    except Exception as e:
+        print(f"Oups - could not look up {email}:", e)
+        return None
+
+class Frontier:
+    """Units already visited, people already emitted, and emails already processed
+    by the extractors.
+
+    With a name, the frontier is stored in `<name>_frontier.jsonl` and shared by
+    all the extractors and runs using the same name."""
+
+    def __init__(self, name: str | None = FRONTIER):
+        self.store = CacheStore(f"{name}_frontier.jsonl") if name else None
+        self.units: set[str] = set()
+        self.people: set[str] = set()
+        self.emails: set[str] = set()
+        kinds = {"unit": self.units, "person": self.people, "email": self.emails}
+        for key in self.store.keys() if self.store is not None else []:
+            kind, _, value = key.partition(":")
+            kinds[kind].add(value)
+
+    def visited(self, unit: str) -> bool:
+        return unit in self.units
+
+    def visit(self, unit: str):
+        if unit not in self.units:
+            self.units.add(unit)
+            if self.store is not None:
+                self.store.set(f"unit:{unit}", True)
+
+    def emitted(self, email: str) -> bool:
+        return email in self.people
+
+    def emit(self, email: str):
+        if email not in self.people:
+            self.people.add(email)
+            if self.store is not None:
+                self.store.set(f"person:{email}", True)
+
+    def finished(self, email: str) -> bool:
+        return email in self.emails
+
+    def finish(self, email: str):
+        """Marks the email as processed, once all its rows have been written."""
+        self.cover(email)
+        if email not in self.emails:
+            self.emails.add(email)
+            if self.store is not None:
+                self.store.set(f"email:{email}", True)
+
+    def cover(self, email: str):
+        """Marks the unit of the person as visited, once their email has been processed.
+        A person with several units is not covered, as only one of their units, the
+        one looking like a lab, is explored."""
+        units = lookup_units(email)
+        if units and len(units) == 1:
+            self.visit(units[0])
+
+    def plan(self, emails: list[str]) -> tuple[list[str], list[str]]:
+        """Splits the emails in the ones still to process, and the ones which are
+        already covered: processed or emitted before, or with all their units visited before or
+        claimed by an earlier email of the list. Only the emails with a single unit
+        claim it, as the others only get one of their units explored. Only the cached
+        person lookups are used, so this costs no model call. An email whose lookup
+        fails is still to process.
+
+        Returns:
+            tuple[list[str], list[str]]: the emails to process, and the skipped emails"""
+        todo, skipped = [], []
+        claimed = set(self.units)
+        for email in emails:
+            units = lookup_units(email)
+            if self.finished(email) or self.emitted(email) or (units and claimed.issuperset(units)):
+                skipped.append(email)
+            else:
+                todo.append(email)
+                if units and len(units) == 1:
+                    claimed.update(units)
+        return todo, skipped
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
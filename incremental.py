@@ -0,0 +1,67 @@
+import hashlib
+import json
+from common import cache_store, get_response_cached_async
+from workers import load_json_async
+
+# Incremental re-crawl: the records of get_json_cached are fetched again with
+# conditional requests, and compared to the previous ones by the hash of their
+# content, so that the records which really changed are known.
+#
+# The ETag, Last-Modified, and hash of every record are kept in
+# `validators_cache.jsonl`. A record which is still fresh under CACHE_TTL isn't
+# requested at all.
+
+def content_hash(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+class ChangeTracker:
+    """Fetches the JSON records again, and keeps the URLs whose content changed."""
+
+    def __init__(self, name: str = "get_json_cached"):
+        self.cache = cache_store(name)
+        self.validators = cache_store("validators")
+        self.changed: set[str] = set()
+        self.fetched = 0
+        self.not_modified = 0
+
+    def conditional_headers(self, key: str) -> dict:
+        validator = self.validators.get(key) or {}
+        headers = {}
+        if key in self.cache:
+            if validator.get("etag"):
+                headers["If-None-Match"] = validator["etag"]
+            if validator.get("last_modified"):
+                headers["If-Modified-Since"] = validator["last_modified"]
+        return headers
+
+    async def fetch_json(self, url: str):
+        """Same as get_json_cached_async, but a cached record is only served as is
+        if it is fresh, and else requested again, with the validators of the last
+        response. A new record is added to `changed` if its content differs."""
+        key = str((url,))
+        if self.cache.policy.ttl is not None and self.cache.is_fresh(key):
+            return self.cache.get(key)
+        response = await get_response_cached_async(url, self.conditional_headers(key))
+        self.fetched += 1
+        if response.status_code == 304:
+            self.not_modified += 1
+            value = self.cache.get(key)
+            # Restarts the TTL of the record.
+            self.cache.set(key, value)
+            return value
+
+        value = await load_json_async(response.content)
+        validator = self.validators.get(key)
+        previous = validator["hash"] if validator else None
+        if previous is None and key in self.cache:
+            previous = content_hash(self.cache.get(key))
+        digest = content_hash(value)
+        if digest != previous:
+            self.changed.add(url)
+        self.cache.set(key, value)
+        self.validators.set(key, {
+            "hash": digest,
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+        })
+        return value
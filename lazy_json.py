@@ -0,0 +1,55 @@
+import json
+from collections.abc import Mapping
+
+# JSON objects which are only parsed one member at a time.
+#
+# When a dict is written by encode(), the offsets of its members are kept next
+# to the JSON text. LazyObject then only parses the members which are read, so
+# that reading the `head` and `people` of a unit never builds its addresses,
+# paths, or admin data.
+
+def encode(value) -> tuple[bytes, dict | None]:
+    """Returns the same JSON as json.dumps, and if the value is a dict, the start
+    and end offsets of its members as `{member: [start, end]}`."""
+    if not isinstance(value, dict) or not all(isinstance(key, str) for key in value):
+        return json.dumps(value).encode(), None
+    parts = []
+    spans = {}
+    position = 1
+    for key, member in value.items():
+        prefix = json.dumps(key) + ": "
+        text = json.dumps(member)
+        spans[key] = [position + len(prefix), position + len(prefix) + len(text)]
+        parts.append(prefix + text)
+        position += len(prefix) + len(text) + 2
+    # json.dumps escapes all non-ASCII characters, so the offsets in characters
+    # are also the offsets in bytes.
+    return ("{" + ", ".join(parts) + "}").encode(), spans
+
+class LazyObject(Mapping):
+    """Read-only JSON object, whose members are parsed when they are first read."""
+    __slots__ = ("data", "spans", "values")
+
+    def __init__(self, data: bytes, spans: dict):
+        self.data = data
+        self.spans = spans
+        self.values = {}
+
+    def __getitem__(self, key: str):
+        if key not in self.values:
+            start, end = self.spans[key]
+            self.values[key] = json.loads(self.data[start:end])
+        return self.values[key]
+
+    def __contains__(self, key) -> bool:
+        return key in self.spans
+
+    def __iter__(self):
+        return iter(self.spans)
+
+    def __len__(self) -> int:
+        return len(self.spans)
+
+    def to_dict(self) -> dict:
+        """Parses the whole object."""
+        return json.loads(self.data)
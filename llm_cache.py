@@ -0,0 +1,173 @@
+import atexit
+import hashlib
+import importlib
+import json
+import os
+import threading
+import zlib
+import numpy as np
+from pydantic import BaseModel
+from cache_store import CachePolicy, CacheStore
+from metrics import metrics, with_mixin
+
+# Cache of the responses of the model, so that re-running a script with the same
+# instructions, inputs, and tool outputs doesn't wait for the model again.
+#
+# A request is looked up by the hash of the model id, the messages, the tools,
+# and the response format. With LLM_CACHE_SIMILARITY, a request which only
+# differs slightly in the text of its messages, like a date or some whitespace,
+# also matches a cached response if the cosine similarity of their embeddings
+# is at least this value. The embedding is a local hashed bag of character
+# trigrams, which needs no model. Beware that a near-match can also pair an
+# email with a very similar one, so keep the value close to 1.
+# Streamed responses are not cached.
+
+LLM_CACHE_FILE = "llm_response_cache.jsonl"
+LLM_CACHE_SIMILARITY = float(os.environ.get("LLM_CACHE_SIMILARITY") or 0) or None
+LLM_CACHE_POLICY = CachePolicy(
+    ttl=float(os.environ.get("LLM_CACHE_TTL") or 0) or None,
+    max_entries=int(os.environ.get("LLM_CACHE_ENTRIES", "10000")),
+)
+EMBEDDING_SIZE = 512
+
+def embed(text: str) -> np.ndarray:
+    """Returns the normalized vector of the hashed character trigrams of the text."""
+    vector = np.zeros(EMBEDDING_SIZE, dtype=np.float32)
+    data = " ".join(text.split()).lower().encode()
+    for i in range(len(data) - 2):
+        vector[zlib.crc32(data[i:i + 3]) % EMBEDDING_SIZE] += 1
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def request_fields(model, messages, response_format, tools, tool_choice) -> tuple[str, str, str]:
+    """Returns the exact key of the request, the key of the requests which can
+    near-match it, and the text of its messages."""
+    if isinstance(response_format, type) and issubclass(response_format, BaseModel):
+        response_format = response_format.model_json_schema()
+    setup = json.dumps([model.get_provider(), model.id, tools, response_format, tool_choice,
+        [message.role for message in messages]], sort_keys=True, default=str)
+    conversation = json.dumps([[message.role, message.content, message.name, message.tool_call_id,
+        message.tool_calls] for message in messages], sort_keys=True, default=str)
+    bucket = hashlib.sha256(setup.encode()).hexdigest()
+    key = hashlib.sha256((setup + conversation).encode()).hexdigest()
+    text = "\n".join(str(message.content) for message in messages)
+    return key, bucket, text
+
+class ResponseCache:
+    """Responses of the model by request, with their hit-rate statistics."""
+
+    def __init__(self, path: str = LLM_CACHE_FILE, policy: CachePolicy = LLM_CACHE_POLICY,
+            similarity: float | None = LLM_CACHE_SIMILARITY):
+        self.store = CacheStore(path, policy)
+        self.similarity = similarity
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        # bucket -> {key: embedding}, read from the store on the first near-match.
+        self.vectors: dict[str, dict[str, np.ndarray]] | None = None
+
+    def _load_vectors(self):
+        self.vectors = {}
+        for key in self.store.keys():
+            entry = self.store.get(key)
+            if entry.get("vector") is not None:
+                self.vectors.setdefault(entry["bucket"], {})[key] = np.array(entry["vector"], dtype=np.float32)
+
+    def _near(self, bucket: str, vector: np.ndarray) -> str | None:
+        if self.vectors is None:
+            self._load_vectors()
+        candidates = {key: cached for key, cached in self.vectors.get(bucket, {}).items()
+            if self.store.is_fresh(key)}
+        if not candidates:
+            return None
+        keys = list(candidates)
+        scores = np.stack([candidates[key] for key in keys]) @ vector
+        best = int(np.argmax(scores))
+        return keys[best] if scores[best] >= self.similarity else None
+
+    def lookup(self, key: str, bucket: str, text: str):
+        """Returns the cached response of the request, or None."""
+        with self.lock:
+            near = False
+            if not self.store.is_fresh(key) and self.similarity is not None:
+                near_key = self._near(bucket, embed(text))
+                if near_key is not None:
+                    key, near = near_key, True
+            entry = self.store.get(key) if self.store.is_fresh(key) else None
+            response = None
+            if entry is not None:
+                try:
+                    module, _, name = entry["type"].partition(":")
+                    response = getattr(importlib.import_module(module), name).model_validate(entry["response"])
+                except Exception as e:
+                    print("Ignoring a cached response which could not be restored:", e)
+            if response is None:
+                self.misses += 1
+            elif near:
+                self.near_hits += 1
+            else:
+                self.hits += 1
+        metrics.count("llm_cache.misses" if response is None else "llm_cache.hits")
+        return response
+
+    def save(self, key: str, bucket: str, text: str, response):
+        if not isinstance(response, BaseModel):
+            return
+        vector = embed(text) if self.similarity is not None else None
+        entry = {
+            "type": f"{type(response).__module__}:{type(response).__qualname__}",
+            "response": response.model_dump(mode="json"),
+            "bucket": bucket,
+            "vector": None if vector is None else vector.round(4).tolist(),
+        }
+        with self.lock:
+            self.store.set(key, entry)
+            if self.vectors is not None and vector is not None:
+                self.vectors.setdefault(bucket, {})[key] = vector
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+            "entries": len(self.store),
+        }
+
+response_cache: ResponseCache | None = None
+
+class CachedModel:
+    """Mixin answering the requests of the model from the response cache."""
+
+    def invoke(self, messages, response_format=None, tools=None, tool_choice=None):
+        fields = request_fields(self, messages, response_format, tools, tool_choice)
+        response = response_cache.lookup(*fields)
+        if response is None:
+            response = super().invoke(messages=messages, response_format=response_format,
+                tools=tools, tool_choice=tool_choice)
+            response_cache.save(*fields, response)
+        return response
+
+    async def ainvoke(self, messages, response_format=None, tools=None, tool_choice=None):
+        fields = request_fields(self, messages, response_format, tools, tool_choice)
+        response = response_cache.lookup(*fields)
+        if response is None:
+            response = await super().ainvoke(messages=messages, response_format=response_format,
+                tools=tools, tool_choice=tool_choice)
+            response_cache.save(*fields, response)
+        return response
+
+def print_stats():
+    stats = response_cache.stats()
+    print(f"LLM cache: {stats['hits']} hits, {stats['near_hits']} near hits, {stats['misses']} misses, "
+        f"{stats['hit_rate']:.0%} hit rate, {stats['entries']} entries")
+
+def cache_responses(model):
+    """Returns the model with the response cache in front of it."""
+    global response_cache
+    if response_cache is None:
+        response_cache = ResponseCache()
+        atexit.register(print_stats)
+    return with_mixin(model, CachedModel)
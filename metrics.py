@@ -0,0 +1,150 @@
+import asyncio
+import atexit
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Timers and counters of the hot paths: the fetches, the cache lookups, the tools,
+# and the model calls with their tokens.
+#
+# With METRICS=<name>, a JSON summary of the run is written to <name>_metrics.json
+# at exit, and with TRACE=1 the spans are also written to <name>_trace.json as
+# Chrome trace events, to be opened in chrome://tracing or https://ui.perfetto.dev.
+# The spans of concurrent tasks each get their own row of the trace.
+
+METRICS = os.environ.get("METRICS")
+TRACE = os.environ.get("TRACE", "0") != "0"
+
+class Metrics:
+    def __init__(self, trace: bool = TRACE):
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.counters: dict[str, float] = {}
+        # name -> [count, total seconds, max seconds]
+        self.timers: dict[str, list[float]] = {}
+        self.trace = trace
+        self.events: list[dict] = []
+        # name -> function returning more figures for the summary, like the
+        # queues of the rate limiter.
+        self.sources = {}
+
+    def count(self, name: str, value: float = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, name: str, start: float, seconds: float, args: dict | None = None):
+        with self.lock:
+            timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+            if self.trace:
+                self.events.append({"name": name, "ph": "X", "pid": os.getpid(), "tid": current_row(),
+                    "ts": (start - self.start) * 1e6, "dur": seconds * 1e6, "args": args or {}})
+
+    @contextmanager
+    def span(self, name: str, **args):
+        """Times the block under `name`. The arguments only go to the trace."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter() - start, args)
+
+    def timed(self, name: str | None = None):
+        """Decorator timing every call of the function, for coroutine functions too.
+        It keeps the name, docstring, and signature, so it can wrap agent tools."""
+        def decorator(func):
+            label = name or func.__name__
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(label):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(label):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def summary(self) -> dict:
+        with self.lock:
+            counters = dict(self.counters)
+            timers = {name: {"count": count, "total": round(total, 6), "avg": round(total / count, 6),
+                "max": round(longest, 6)} for name, (count, total, longest) in self.timers.items()}
+        hit_rates = {}
+        for name in counters:
+            if name.endswith(".hits"):
+                prefix = name[:-len(".hits")]
+                lookups = counters[name] + counters.get(f"{prefix}.misses", 0)
+                hit_rates[prefix] = round(counters[name] / lookups, 4) if lookups else 0.0
+        return {"wall": round(time.perf_counter() - self.start, 6), "counters": counters,
+            "hit_rates": hit_rates, "timers": timers,
+            **{name: source() for name, source in self.sources.items()}}
+
+    def write(self, name: str):
+        with open(f"{name}_metrics.json", "w") as f:
+            json.dump(self.summary(), f, indent=2)
+        if self.trace:
+            with self.lock:
+                events = list(self.events)
+            with open(f"{name}_trace.json", "w") as f:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+def current_row() -> int:
+    """The row of the trace: the asyncio task if there is one, else the thread."""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return id(task) if task is not None else threading.get_ident()
+
+metrics = Metrics()
+
+if METRICS:
+    atexit.register(metrics.write, METRICS)
+
+def usage_tokens(response) -> tuple[int, int]:
+    """Returns the prompt and completion tokens of a response of Anthropic or OpenAI."""
+    usage = getattr(response, "usage", None)
+    prompt = getattr(usage, "input_tokens", None) or getattr(usage, "prompt_tokens", None) or 0
+    completion = getattr(usage, "output_tokens", None) or getattr(usage, "completion_tokens", None) or 0
+    return prompt, completion
+
+class InstrumentedModel:
+    """Mixin timing the calls of the model, and counting their tokens."""
+
+    def _count_usage(self, response):
+        prompt, completion = usage_tokens(response)
+        metrics.count("model.calls")
+        metrics.count("model.prompt_tokens", prompt)
+        metrics.count("model.completion_tokens", completion)
+
+    def invoke(self, *args, **kwargs):
+        with metrics.span("model.invoke", model=self.id):
+            response = super().invoke(*args, **kwargs)
+        self._count_usage(response)
+        return response
+
+    async def ainvoke(self, *args, **kwargs):
+        with metrics.span("model.invoke", model=self.id):
+            response = await super().ainvoke(*args, **kwargs)
+        self._count_usage(response)
+        return response
+
+def with_mixin(model, mixin):
+    """Returns a copy of the model, whose class also derives from the mixin."""
+    cls = type(model)
+    extended = type(f"{mixin.__name__.removesuffix('Model')}{cls.__name__}", (mixin, cls), {})
+    # A copy, as Python can't switch the instance to a class whose first base
+    # isn't the one of the model.
+    copy = extended.__new__(extended)
+    copy.__dict__.update(model.__dict__)
+    return copy
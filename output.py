@@ -0,0 +1,89 @@
+import json
+import os
+from common import on_exit
+from frontier import Frontier, FRONTIER
+from rse import RSEDescription
+
+# Name of the output of a run, like `rse` for rse.csv and rse.jsonl. The rows
+# and the processed emails are kept, so that an interrupted run resumes where
+# it stopped. Without it, the rows are printed and nothing is kept.
+OUTPUT = os.environ.get("OUTPUT")
+
+def read_rows(path: str) -> list[dict]:
+    """Returns the rows of a JSONL output, without a last line cut by an interruption."""
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb+") as file:
+        data = file.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            file.truncate(end)
+    return [json.loads(line) for line in data[:end].splitlines()]
+
+def row_key(row: dict) -> str:
+    """Returns the email of the person of a row, or the unit for the rows without a person."""
+    return row["person_email"] or f"unit:{row['unit_name']}"
+
+def diff_rows(old: list[dict], new: list[dict]) -> tuple[list[dict], list[dict], list[tuple[dict, dict]]]:
+    """Compares two outputs by the email of the people, and the rows without a
+    person, like the unresolved units, by their unit.
+
+    Returns:
+        tuple[list[dict], list[dict], list[tuple[dict, dict]]]: the rows of the people
+        who were added, of the ones who left, and the old and new rows of the ones
+        whose unit or position changed"""
+    old_rows = {row_key(row): row for row in old}
+    new_rows = {row_key(row): row for row in new}
+    added = [row for email, row in new_rows.items() if email not in old_rows]
+    left = [row for email, row in old_rows.items() if email not in new_rows]
+    changed = [(old_rows[email], row) for email, row in new_rows.items() if email in old_rows and
+        (old_rows[email]["unit_name"], old_rows[email]["position"]) != (row["unit_name"], row["position"])]
+    return added, left, changed
+
+class RSEOutput:
+    """Writes the RSEs as soon as they are found, every RSE only once.
+
+    With a name, the rows go to `<name>.jsonl` and `<name>.csv`, and the emails
+    and units done are checkpointed in the frontier, which defaults to
+    `<name>_frontier.jsonl`. Every row is flushed when it is written, and the
+    files are closed on Ctrl-C."""
+
+    def __init__(self, name: str | None = OUTPUT, frontier: Frontier | None = None):
+        self.frontier = frontier if frontier is not None else Frontier(FRONTIER or name)
+        self.name = name
+        self.jsonl = self.csv = None
+        if name:
+            # The JSONL rows are the reference, the CSV is rewritten from them
+            # in case the interruption happened between the two writes.
+            rows = [RSEDescription(**row) for row in read_rows(f"{name}.jsonl")]
+            self.jsonl = open(f"{name}.jsonl", "a", buffering=1)
+            self.csv = open(f"{name}.csv", "w", buffering=1)
+            for rse in rows:
+                if rse.person_email:
+                    self.frontier.emit(rse.person_email)
+                self.csv.write(rse.csv() + "\n")
+        on_exit(self.close)
+
+    def write(self, rse: RSEDescription) -> bool:
+        """Writes the RSE if it hasn't been written before, and returns whether it was.
+        The rows without a person are always written."""
+        if rse.person_email and self.frontier.emitted(rse.person_email):
+            return False
+        if self.jsonl is None:
+            print(rse.csv())
+        else:
+            self.jsonl.write(rse.model_dump_json() + "\n")
+            self.csv.write(rse.csv() + "\n")
+        if rse.person_email:
+            self.frontier.emit(rse.person_email)
+        return True
+
+    def finish(self, email: str):
+        """Checkpoints the email, once all its RSEs have been written."""
+        self.frontier.finish(email)
+
+    def close(self):
+        for file in (self.jsonl, self.csv):
+            if file is not None and not file.closed:
+                file.close()
+        self.frontier.close()
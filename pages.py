@@ -0,0 +1,67 @@
+import asyncio
+import marshal
+from bs4 import BeautifulSoup
+from markdownify import MarkdownConverter
+from common import cache_store
+from convert import content_hash, convert_page, main_content
+from metrics import metrics
+from workers import offloaded, run
+
+# Conversion of web pages to the markdown given to the models.
+#
+# Only the main content of a page is kept: scripts, styles, and navigation are
+# dropped before the conversion, and so are the headers, footers, and forms of the
+# page around the content, but not the ones of the content itself, like the
+# headline and byline of an article. The markdown is cached
+# in `page_markdown_cache.jsonl`, by the hash of the raw HTML, and by the hash of
+# the main content. So a page seen before costs one hash, and a page whose main
+# content is unchanged, like a new ad or menu around the same article, costs the
+# parsing, but not the conversion.
+#
+# With WORKERS, the large pages are parsed and converted in the process pool, so
+# that pages converted from several threads, like by page_markdown_async, use
+# all the cores. The rules of the main content are in convert.py, which the
+# workers import.
+
+# Version of the rules of convert.main_content, in the keys of the raw pages, so
+# that the pages cached with other rules are converted again.
+RULES = 3
+
+def page_markdown(html: str) -> str:
+    """Returns the main content of the HTML page as markdown."""
+    store = cache_store("page_markdown")
+    raw_key = f"raw{RULES}:{content_hash(html)}"
+    markdown = store.get(raw_key)
+    if markdown is not None:
+        metrics.count("page_markdown.hits")
+        return markdown
+    pool = offloaded(len(html))
+    if pool is not None:
+        # The worker parses and converts in one go, as a lookup by the main content
+        # in between would cost a second round-trip.
+        metrics.count("page_markdown.misses")
+        main_hash, markdown = marshal.loads(run(pool, convert_page, html))
+        if markdown:
+            store.set(f"main:{main_hash}", markdown)
+            store.set(raw_key, markdown)
+        return markdown
+    with metrics.span("page_markdown.parse"):
+        main = main_content(BeautifulSoup(html, "lxml"))
+    main_key = f"main:{content_hash(str(main))}"
+    markdown = store.get(main_key)
+    if markdown is None:
+        metrics.count("page_markdown.misses")
+        with metrics.span("page_markdown.convert"):
+            markdown = MarkdownConverter().convert_soup(main).strip()
+        if not markdown:
+            # Not cached, as an empty page is more likely an error page than the content.
+            return markdown
+        store.set(main_key, markdown)
+    else:
+        metrics.count("page_markdown.hits")
+    store.set(raw_key, markdown)
+    return markdown
+
+async def page_markdown_async(html: str) -> str:
+    """Same as page_markdown, in a thread, so that several pages can be converted at once."""
+    return await asyncio.to_thread(page_markdown, html)
@@ -0,0 +1,133 @@
+import os
+import re
+import sys
+import time
+from collections.abc import Iterable, Mapping
+import numpy as np
+from rank_bm25 import BM25Okapi
+from common import cache_store, UNIT_PATH
+
+# Classification of the positions of all the people at once, instead of looking up
+# every position in the hand-written sets.
+#
+# The positions are put in a column, lowercased, and stripped of extra whitespace,
+# and only the distinct ones are matched against the known positions: exactly, or
+# else by BM25 over the character trigrams of their words, so that 'Postdoc
+# Researcher' or 'Senior Research Software Engineer' still find their closest
+# known position. The confidence is 1 for an exact match, and else the BM25 score
+# relative to the one of the known position itself, times the share of the
+# trigrams of the position which are found in it.
+#
+# Run `python positions.py` to classify the positions of all the cached units.
+
+# Minimum confidence for a position to be taken as RSE-like or not. Below it, the
+# position is unknown.
+POSITION_CONFIDENCE = float(os.environ.get("POSITION_CONFIDENCE", "0.8"))
+
+def trigrams(text: str) -> list[str]:
+    """Returns the character trigrams of the words of the text, with their boundaries."""
+    grams = []
+    for word in re.findall(r"\w+", text):
+        word = f" {word} "
+        grams += [word[i:i + 3] for i in range(len(word) - 2)]
+    return grams
+
+def normalize(positions) -> tuple[np.ndarray, np.ndarray]:
+    """Lowercases the positions and collapses their whitespace, a missing position
+    being the empty string.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: the distinct normalized positions, and the
+        index of every position in them"""
+    column = np.asarray(positions, dtype=object)
+    column = np.strings.lower(np.where(column == None, "", column).astype(str))
+    distinct, inverse = np.unique(column, return_inverse=True)
+    # Only the distinct positions go through Python, to collapse the whitespace.
+    collapsed = np.array([" ".join(position.split()) for position in distinct], dtype=str)
+    distinct, merged = np.unique(collapsed, return_inverse=True)
+    return distinct, merged[inverse]
+
+class PositionClassifier:
+    """Matches positions to the known RSE-like and non RSE-like positions."""
+
+    def __init__(self, rse: Iterable[str | None], non_rse: Iterable[str | None]):
+        known = {}
+        for positions, label in ((non_rse, False), (rse, True)):
+            names, _ = normalize(list(positions))
+            known.update({name: label for name in names})
+        self.names = list(known)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        # The last entry stands for the positions matching nothing.
+        self.labels = np.array(list(known.values()) + [False])
+        self.matched = np.array(self.names + [""], dtype=object)
+        documents = [trigrams(name) or [" "] for name in self.names]
+        self.bm25 = BM25Okapi(documents)
+        self.grams = [set(document) for document in documents]
+        self.self_scores = np.array([self.bm25.get_scores(document)[i] for i, document in enumerate(documents)])
+        # normalized position -> (index of the known position, confidence)
+        self.matches: dict[str, tuple[int, float]] = {}
+
+    def match(self, position: str) -> tuple[int, float]:
+        """Returns the index of the closest known position, -1 if there is none,
+        and the confidence of the match, for a normalized position."""
+        if position in self.index:
+            return self.index[position], 1.0
+        if position not in self.matches:
+            grams = trigrams(position)
+            scores = self.bm25.get_scores(grams) if grams else np.zeros(1)
+            best = int(np.argmax(scores))
+            if scores[best] <= 0:
+                self.matches[position] = -1, 0.0
+            else:
+                coverage = len(set(grams) & self.grams[best]) / len(set(grams))
+                self.matches[position] = best, min(1.0, scores[best] / self.self_scores[best]) * coverage
+        return self.matches[position]
+
+    def classify(self, positions) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Classifies a column of positions.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray]: for every position, whether
+            it is RSE-like, the confidence, and the known position it matched"""
+        distinct, inverse = normalize(positions)
+        found = [self.match(position) for position in distinct]
+        index = np.array([i for i, _ in found], dtype=np.intp)[inverse]
+        confidence = np.array([score for _, score in found], dtype=np.float64)[inverse]
+        return self.labels[index], confidence, self.matched[index]
+
+    def known(self, positions, threshold: float = POSITION_CONFIDENCE) -> tuple[np.ndarray, np.ndarray]:
+        """Returns whether every position is surely RSE-like, and whether it is known at all."""
+        is_rse, confidence, _ = self.classify(positions)
+        sure = confidence >= threshold
+        return is_rse & sure, sure
+
+def people_table(units: Iterable[Mapping]) -> dict[str, np.ndarray]:
+    """Returns the columns unit, email, and position of all the people of the units."""
+    columns = {"unit": [], "email": [], "position": []}
+    for unit in units:
+        people = unit.get("people") or []
+        columns["unit"] += [unit.get("acronym")] * len(people)
+        columns["email"] += [person.get("email") for person in people]
+        columns["position"] += [person.get("position") for person in people]
+    return {name: np.array(column, dtype=object) for name, column in columns.items()}
+
+def cached_units(name: str = "get_json_cached") -> list[Mapping]:
+    """Returns all the units in the cache of the given function."""
+    store = cache_store(name)
+    # Both the units searched by name and the ones requested by acronym.
+    prefix = UNIT_PATH.split("?")[0] + "?"
+    units = [store.get_lazy(key) for key in store.keys() if prefix in key]
+    return [unit for unit in units if isinstance(unit, Mapping) and "people" in unit]
+
+if __name__ == "__main__":
+    from rse import non_rse_positions, rse_positions
+    table = people_table(cached_units(*sys.argv[1:]))
+    start = time.perf_counter()
+    is_rse, confidence, matched = PositionClassifier(rse_positions, non_rse_positions).classify(table["position"])
+    seconds = time.perf_counter() - start
+    positions, first, counts = np.unique(table["position"].astype(str), return_index=True, return_counts=True)
+    for i in np.argsort(confidence[first], kind="stable"):
+        row = first[i]
+        print(f"{counts[i]:>6} {confidence[row]:.2f} {'RSE' if is_rse[row] else '-':<3} '{positions[i]}' -> '{matched[row]}'")
+    print(f"{len(is_rse)} people, {len(positions)} positions, {is_rse.sum()} RSE-like, "
+        f"{(confidence < POSITION_CONFIDENCE).sum()} unknown, in {seconds:.3f}s")
@@ -0,0 +1,133 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+
+# How often a request waiting for a free connection slot checks again.
+SLOT_POLL = 0.01
+
+@dataclass
+class HostLimit:
+    """Requests per second, size of the bursts, and concurrent requests allowed for a host."""
+    rate: float
+    burst: int
+    concurrency: int
+
+class HostState:
+    def __init__(self, limit: HostLimit):
+        self.limit = limit
+        self.tokens = float(limit.burst)
+        self.updated = time.monotonic()
+        self.in_flight = 0
+        self.waiting = 0
+        self.requests = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+class RateLimiter:
+    """Token bucket rate limiter with a cap on the concurrent requests, per host.
+
+    Every request takes a token, and the tokens refill at `rate` per second up to
+    `burst`. The same limiter is shared by threads and event loops: `limit` is used
+    around synchronous requests, and `limit_async` around asynchronous ones."""
+
+    def __init__(self, default: HostLimit):
+        self.default = default
+        self.limits: dict[str, HostLimit] = {}
+        self.hosts: dict[str, HostState] = {}
+        self.lock = threading.Lock()
+
+    def configure(self, host: str, limit: HostLimit):
+        with self.lock:
+            self.limits[host] = limit
+            self.hosts.pop(host, None)
+
+    def _state(self, host: str) -> HostState:
+        if host not in self.hosts:
+            self.hosts[host] = HostState(self.limits.get(host, self.default))
+        return self.hosts[host]
+
+    def _refill(self, state: HostState):
+        now = time.monotonic()
+        state.tokens = min(state.limit.burst, state.tokens + (now - state.updated) * state.limit.rate)
+        state.updated = now
+
+    def _try_acquire(self, host: str) -> float:
+        """Takes a token and a connection slot, or returns the seconds to wait before trying again."""
+        with self.lock:
+            state = self._state(host)
+            self._refill(state)
+            if state.in_flight >= state.limit.concurrency:
+                return SLOT_POLL
+            if state.tokens < 1:
+                return (1 - state.tokens) / state.limit.rate
+            state.tokens -= 1
+            state.in_flight += 1
+            return 0
+
+    def _acquired(self, host: str, waited: float):
+        with self.lock:
+            state = self._state(host)
+            state.waiting -= 1
+            state.requests += 1
+            state.wait_total += waited
+            state.wait_max = max(state.wait_max, waited)
+
+    def _release(self, host: str):
+        with self.lock:
+            self._state(host).in_flight -= 1
+
+    def _enqueue(self, host: str, delta: int = 1):
+        with self.lock:
+            self._state(host).waiting += delta
+
+    @contextmanager
+    def limit(self, host: str):
+        start = time.monotonic()
+        self._enqueue(host)
+        try:
+            while (wait := self._try_acquire(host)) > 0:
+                time.sleep(wait)
+        except BaseException:
+            self._enqueue(host, -1)
+            raise
+        self._acquired(host, time.monotonic() - start)
+        try:
+            yield
+        finally:
+            self._release(host)
+
+    @asynccontextmanager
+    async def limit_async(self, host: str):
+        start = time.monotonic()
+        self._enqueue(host)
+        try:
+            while (wait := self._try_acquire(host)) > 0:
+                await asyncio.sleep(wait)
+        except BaseException:
+            self._enqueue(host, -1)
+            raise
+        self._acquired(host, time.monotonic() - start)
+        try:
+            yield
+        finally:
+            self._release(host)
+
+    def metrics(self) -> dict[str, dict]:
+        """Returns per host the tokens available, the requests in flight and waiting,
+        and the time requests spent waiting for their turn."""
+        with self.lock:
+            metrics = {}
+            for host, state in self.hosts.items():
+                self._refill(state)
+                metrics[host] = {
+                    "tokens_available": round(state.tokens, 2),
+                    "in_flight": state.in_flight,
+                    "waiting": state.waiting,
+                    "requests": state.requests,
+                    "queue_wait_total": round(state.wait_total, 3),
+                    "queue_wait_avg": round(state.wait_total / state.requests, 3) if state.requests else 0.0,
+                    "queue_wait_max": round(state.wait_max, 3),
+                }
+            return metrics
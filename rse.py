@@ -0,0 +1,265 @@
+import asyncio
+import functools
+from pydantic import BaseModel, Field
+from common import get_json_cached_async, PERSON_API, UNIT_ACRO_API, UNIT_API
+from frontier import Frontier
+from positions import PositionClassifier
+from tools import page_url
+
+rse_positions = {
+    'Trainee Computer Scientist', 'ETS/HES Engineer', 'Head of Engineering',
+    'Scientific Staff Member', 'HPC Application expert', 'Principal scientist',
+    'HPC application expert', 'Research Associate', 'HPC System Manager',
+    'Technical Specialist', 'System specialist', 'Systems Engineer',
+    'Scientific Advisor', 'Senior Scientist', 'Postdoctoral Researcher',
+    'Scientist', 'Information Specialist', 'Technical Employee', 'Engineer',
+    'Research Software Engineer', 'Head of IT', 'Scientific Assistant',
+    'Executive Assistant', 'DevOps Specialist', 'Computer Scientist',
+    'Data Scientist'
+}
+
+class RSEDescription(BaseModel):
+    organization: str = Field(..., description="Abbreviation of the rganization this unit is in - a school, college, or vice-presidency.")
+    unit_name: str = Field(..., description="Abbreviation of the unit or the lab.")
+    unit_head: str = Field(..., description="Head of the unit.")
+    person_name: str = Field(..., description="Name of the person.")
+    person_email: str = Field(..., description="Email of the person.")
+    position: str = Field(..., description="Position of the person.")
+    page_url: str = Field(..., description="URL of the person's page.")
+
+    def csv(self) -> str:
+        """Generate a CSV representation of the RSEDescription instance."""
+        return f"{self.organization},{self.unit_name},{self.unit_head},{self.person_name},{self.position},{self.page_url}"
+
+
+class RSEs(BaseModel):
+    rses: list[RSEDescription]
+
+# Positions which are clearly not RSE-like, as opposed to the positions
+# not found in either set, which need a closer look.
+non_rse_positions = {
+    'Lecturer', 'Doctoral Assistant', 'Full Professor', 'Project Student',
+    'Associate Professor', 'Tenure Track Assistant Professor', 'Safety Delegate',
+    'Adjunct Professor', 'Administrative Assistant', 'Guest', 'Visiting Professor',
+    'Guest PhD Student', 'External Student', 'Committee Member', 'Student/Auxiliary',
+    'Secretary', 'Assistant Professor', 'Host Professor', 'Student Body Member',
+    'Academic Guest', 'Administrative Specialist', 'Teaching Staff Member',
+    'Professor Emeritus/Teaching Staff Member', 'Accountant', 'President', 'Treasurer',
+    'Vice-President of Association', 'Financial Manager', 'Finance Manager',
+    'Financial Coordinator', 'Administrative Employee', 'Administrative Manager',
+    'Administrative Deputy', 'Communication Specialist', 'Communication Manager',
+    'Communication and Events', 'Communication Project Manager', 'Construction Assistant',
+    None
+}
+
+@functools.cache
+def position_classifier() -> PositionClassifier:
+    return PositionClassifier(rse_positions, non_rse_positions)
+
+async def prefetch(emails: list[str], concurrency: int,
+        person_api: str = PERSON_API, unit_api: str = UNIT_API) -> tuple[dict, dict]:
+    """Fetches the persons of all emails, and the units of their accreditations,
+    with at most `concurrency` requests in flight.
+    Every unit is only requested once, even if it is found while another
+    request for it is still running.
+
+    Returns:
+        tuple[dict, dict]: the persons by email, and the units by name"""
+    semaphore = asyncio.Semaphore(concurrency)
+    units: dict[str, asyncio.Task] = {}
+
+    async def fetch(url: str):
+        async with semaphore:
+            return await get_json_cached_async(url)
+
+    async def fetch_person(email: str):
+        results = await fetch(person_api.format(email))
+        if len(results) == 1:
+            for accred in results[0]["accreds"]:
+                path = accred["path"].split("/")
+                if path[1] != "ETU" and path[-1] not in units:
+                    units[path[-1]] = asyncio.create_task(fetch(unit_api.format(path[-1])))
+        return results
+
+    persons = await asyncio.gather(*[fetch_person(email) for email in emails])
+    unit_results = await asyncio.gather(*units.values())
+    return dict(zip(emails, persons)), dict(zip(units, unit_results))
+
+def extract(emails: list[str], get_person, get_unit, output=print,
+        frontier: Frontier | None = None) -> set[str]:
+    """Walks from every email to the units of the person, and outputs one CSV line
+    for the person and for every other RSE found in these units.
+    Lines starting with "1 - " describe the edge cases which were skipped.
+    Units and people already in the frontier are skipped, the default frontier
+    only lives for this call.
+
+    Returns:
+        set[str]: all the positions seen in the units"""
+    positions = set()
+    frontier = frontier or Frontier(None)
+
+    for email in emails:
+        results = get_person(email)
+        if len(results) > 1:
+            output(f"1 - Multiple entries for {email}:")
+            for result in results:
+                output(result["sciper"])
+            continue
+
+        result = results[0]
+        for accred in result["accreds"]:
+            path = accred["path"].split("/")
+            if path[1] == "ETU":
+                continue
+
+            if frontier.visited(path[-1]):
+                output("1 - Already seen", path[-1])
+                continue
+
+            frontier.visit(path[-1])
+            unit = get_unit(path[-1])
+
+            if not "position" in accred:
+                output("1 - No position for", result["email"], accred)
+                continue
+
+            if not "head" in unit or not "email" in unit["head"]:
+                output("1 - No head for", result["email"], accred)
+                continue
+
+            if not frontier.emitted(result["email"]):
+                frontier.emit(result["email"])
+                output(", ".join([path[1], path[-1], unit["head"]["email"], result["email"], accred["position"]]))
+
+            for person in unit["people"]:
+                positions.add(person["position"])
+                if person["position"] in rse_positions:
+                    if "email" in person and "position" in person and \
+                        person["email"] != None and person["position"] != None:
+                        if not frontier.emitted(person["email"]):
+                            frontier.emit(person["email"])
+                            output(", ".join([path[1], path[-1], unit["head"]["email"], person["email"], person["position"]]))
+                        else:
+                            output("1 - Already printed", person["email"])
+
+    return positions
+
+def full_name(person: dict) -> str:
+    return f"{person.get('firstname')} {person.get('name')}"
+
+def classify(results: list, get_unit) -> tuple[list[RSEDescription] | None, str | None]:
+    """Finds the RSEs of the unit of a person without any model, if the case is clear:
+    exactly one person, with one accreditation outside of ETU in a unit with a head,
+    and a position known to be RSE-like or not, up to case and whitespace, or by a
+    match with a confidence of at least POSITION_CONFIDENCE. As in extract(), the
+    other people of the unit whose position is unknown are left out.
+
+    Args:
+        results (list): the response of the ldap API for the email
+        get_unit: function returning the unit for a name
+
+    Returns:
+        tuple[list[RSEDescription] | None, str | None]: the person followed by the RSEs
+        of their unit, or None and the reason why the case is ambiguous"""
+    if len(results) != 1:
+        return None, "Multiple entries" if results else "No entry"
+    result = results[0]
+    accreds = [accred for accred in result["accreds"] if accred["path"].split("/")[1] != "ETU"]
+    if len(accreds) != 1:
+        return None, "Multiple accreditations" if accreds else "No accreditation"
+    accred = accreds[0]
+    if not "position" in accred:
+        return None, "No position"
+    _, known = position_classifier().known([accred["position"]])
+    if not known[0]:
+        return None, f"Unknown position {accred['position']}"
+    path = accred["path"].split("/")
+    unit = get_unit(path[-1])
+    if isinstance(unit, list):
+        # The acronym is the prefix of other units, which the agent tells apart.
+        return None, "Ambiguous unit"
+    if not isinstance(unit, dict) or not unit.get("head") or not "email" in unit["head"]:
+        return None, "No head"
+    is_rse, _ = position_classifier().known([person.get("position") for person in unit["people"]])
+
+    rses = [describe(path, unit, result, accred["position"])]
+    for person, rse in zip(unit["people"], is_rse):
+        if rse and person.get("email") and person["email"] != result["email"]:
+            rses.append(describe(path, unit, person, person["position"]))
+    return rses, None
+
+def describe(path: list[str], unit: dict, person: dict, position: str) -> RSEDescription:
+    return RSEDescription(organization=path[1] if len(path) > 1 else path[0], unit_name=path[-1],
+        unit_head=full_name(unit["head"]), person_name=full_name(person),
+        person_email=person["email"], position=position,
+        page_url=page_url(person.get("profile")) or "")
+
+def unit_rses(unit: dict) -> list[RSEDescription]:
+    """Returns the RSEs of a unit as returned by the unit API, if it has a head."""
+    if not unit.get("head") or not "email" in unit["head"]:
+        return []
+    path = [part["acronym"] for part in unit["path"]]
+    people = unit.get("people", [])
+    is_rse, _ = position_classifier().known([person.get("position") for person in people])
+    return [describe(path, unit, person, person["position"]) for person, rse in zip(people, is_rse)
+        if rse and person.get("email")]
+
+def unresolved_row(name: str) -> RSEDescription:
+    """Returns the row of a unit which didn't resolve to a single unit, without a
+    person, so that it shows in the output to be checked by hand."""
+    return RSEDescription(organization="", unit_name=name, unit_head="", person_name="",
+        person_email="", position="Unresolved unit", page_url="")
+
+def exact_unit(response, name: str) -> dict | None:
+    """Returns the unit of the response with this acronym. The API returns a list
+    of short matches when the name is the prefix of other units, whose path only
+    holds the acronyms. The units above the labs, like schools and institutes,
+    have `subunits` but no `people`."""
+    if isinstance(response, list):
+        response = next((match for match in response if match.get("acronym") == name), None)
+    if not isinstance(response, dict) or "acronym" not in response or "path" not in response:
+        return None
+    return response if all(isinstance(part, dict) for part in response["path"]) else None
+
+async def crawl(root: str, concurrency: int, unit_api: str = UNIT_API,
+        fetch_json=get_json_cached_async, unit_acro_api: str = UNIT_ACRO_API) -> tuple[dict[str, dict], list[str]]:
+    """Walks the unit tree breadth-first from the root acronym, with at most
+    `concurrency` requests in flight. The subunits of a unit are requested as
+    soon as it arrives, and every unit only once. A unit whose acronym is the
+    prefix of others is requested again by its exact acronym.
+    `fetch_json` fetches a URL, like ChangeTracker.fetch_json for a re-crawl.
+
+    Returns:
+        tuple[dict[str, dict], list[str]]: the units by acronym, in breadth-first
+        order, and the acronyms which didn't resolve to a single unit"""
+    semaphore = asyncio.Semaphore(concurrency)
+    units: dict[str, dict] = {}
+    depths: dict[str, int] = {root: 0}
+    unresolved = []
+
+    async def fetch(name: str):
+        async with semaphore:
+            try:
+                response = await fetch_json(unit_api.format(name))
+                if isinstance(response, list) and any(match.get("acronym") == name for match in response):
+                    response = await fetch_json(unit_acro_api.format(name))
+            except Exception as e:
+                print(f"Oups - could not fetch the unit {name}:", e)
+                response = None
+            return name, exact_unit(response, name)
+
+    pending = {asyncio.create_task(fetch(root))}
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            name, unit = task.result()
+            if unit is None:
+                unresolved.append(name)
+                continue
+            units[name] = unit
+            for subunit in unit.get("subunits") or []:
+                if subunit["acronym"] not in depths:
+                    depths[subunit["acronym"]] = depths[name] + 1
+                    pending.add(asyncio.create_task(fetch(subunit["acronym"])))
+    order = sorted(units, key=lambda name: depths[name])
+    return {name: units[name] for name in order}, unresolved
@@ -0,0 +1,79 @@
+"""Local stand-in for the EPFL search API, serving the recorded responses.
+
+Run it with `python standin.py [port] [latency]`, and point the scripts to it with
+`EPFL_API=http://localhost:8000`. Every request is delayed by `latency` seconds
+to mimic the round-trip to the real server. The responses carry an ETag, and
+requests with a matching If-None-Match get a 304."""
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from common import cache_store, EPFL_SEARCH_API, PERSON_PATH, UNIT_ACRO_PATH, UNIT_PATH
+
+# The recorded path of every path and query parameter.
+PATHS = {
+    "/api/ldap": {"q": PERSON_PATH},
+    "/api/unit": {"q": UNIT_PATH, "acro": UNIT_ACRO_PATH},
+}
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    # Set by serve() for every server.
+    latency = 0.0
+    jitter = 0.0
+    records = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if url.path not in PATHS:
+            return self.send_json(404, {"error": f"Unknown path {url.path}"})
+        param, path = next(((param, path) for param, path in PATHS[url.path].items() if param in params),
+            ("q", PATHS[url.path]["q"]))
+        query = params.get(param, [""])[0]
+        data = self.records.get(str((EPFL_SEARCH_API + path.format(query),)))
+        if data is None:
+            return self.send_json(404, {"error": f"No recorded response for {query}"})
+        self.send_json(200, data)
+
+    def send_json(self, status: int, data):
+        body = json.dumps(data).encode()
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            status, body = 304, b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port: int = 8000, latency: float = 0.0, jitter: float = 0.0, records=None) -> ThreadingHTTPServer:
+    """Starts the stand-in in a background thread and returns the server.
+    `records` maps cache keys of get_json_cached to responses, and defaults to its cache.
+    Port 0 picks a free port, which is in `server.server_address`."""
+    handler = type("Handler", (StandinHandler,), {
+        "latency": latency,
+        "jitter": jitter,
+        "records": records if records is not None else cache_store("get_json_cached"),
+    })
+    server = ThreadingHTTPServer(("localhost", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+    server = serve(port, latency)
+    print(f"Serving the recorded EPFL API on http://localhost:{port} with {latency}s latency")
+    threading.Event().wait()
@@ -0,0 +1,101 @@
+import functools
+import json
+from common import get_json_cached, PERSON_API, UNIT_API
+from metrics import metrics
+
+# Agent tools for the EPFL API. The responses are memoized for the run, and
+# trimmed to the fields needed to find the RSEs of a unit, which keeps the
+# context of the model small. get_unit_full still returns the whole record.
+
+def page_url(profile: str | None) -> str | None:
+    return f"https://people.epfl.ch/{profile}" if profile else None
+
+def project_person(results: list) -> list:
+    return [{
+        "name": f"{result.get('firstname')} {result.get('name')}",
+        "email": result.get("email"),
+        "page_url": page_url(result.get("profile")),
+        "units": [{
+            "path": accred.get("path"),
+            "acronym": accred.get("acronym"),
+            "position": accred.get("position"),
+        } for accred in result.get("accreds", [])],
+    } for result in results]
+
+def project_unit(unit) -> dict | list:
+    if isinstance(unit, list):
+        # The search matched more than one unit.
+        return [{"acronym": match.get("acronym"), "path": "/".join(match.get("path", [])),
+            "name": match.get("name")} for match in unit]
+    head = unit.get("head") or {}
+    return {
+        "acronym": unit.get("acronym"),
+        "name": unit.get("name"),
+        "path": "/".join(part["acronym"] for part in unit.get("path", [])),
+        "head": {"name": f"{head.get('firstname')} {head.get('name')}", "email": head.get("email")} if head else None,
+        "people_columns": ["name", "email", "position", "profile"],
+        "people": [[
+            f"{person.get('firstname')} {person.get('name')}",
+            person.get("email"),
+            person.get("position"),
+            person.get("profile"),
+        ] for person in unit.get("people", [])],
+    }
+
+@functools.cache
+def person_json(email: str) -> str:
+    return json.dumps(project_person(get_json_cached(PERSON_API.format(email))), separators=(",", ":"))
+
+@functools.cache
+def unit_json(name: str) -> str:
+    return json.dumps(project_unit(get_json_cached(UNIT_API.format(name))), separators=(",", ":"))
+
+@functools.cache
+def unit_full_json(name: str) -> str:
+    return json.dumps(get_json_cached(UNIT_API.format(name)))
+
+def clear_memo():
+    """Forgets the responses memoized for the current run."""
+    person_json.cache_clear()
+    unit_json.cache_clear()
+    unit_full_json.cache_clear()
+
+@metrics.timed("tool.get_person")
+def get_person(email: str) -> str:
+    """This function returns the description of this person in the EPFL database.
+    It returns their name, page url, and the path, acronym, and position for each of their units.
+
+    Args:
+        email (str): the email of the person
+
+    Returns:
+        str: json of the person"""
+    return person_json(email.strip())
+
+@metrics.timed("tool.get_unit")
+def get_unit(name: str) -> str:
+    """This function returns the description of this unit in the EPFL database.
+    It returns the path, the head, and one row per person with the columns
+    given in people_columns: name, email, position, and profile.
+    The page url of a person is https://people.epfl.ch/{profile}.
+    For some of the units, the name needs to end in "-GE" to get the list of employees.
+
+    Args:
+        name (str): the name of the unit
+
+    Returns:
+        str: json of the unit, including people"""
+    return unit_json(name.strip())
+
+@metrics.timed("tool.get_unit_full")
+def get_unit_full(name: str) -> str:
+    """This function returns the full description of this unit in the EPFL database,
+    including addresses, phones, and offices.
+    Only use it if the information is missing from get_unit.
+
+    Args:
+        name (str): the name of the unit
+
+    Returns:
+        str: json of the full unit"""
+    return unit_full_json(name.strip())
@@ -0,0 +1,71 @@
+import asyncio
+import atexit
+import json
+import marshal
+import multiprocessing
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from convert import decode_json
+from metrics import metrics
+
+# Process pool for the CPU-bound steps, which would else serialize on the GIL once
+# the fetches are concurrent: the decoding of large JSON responses, and the
+# conversion of large pages to markdown.
+#
+# With WORKERS=auto, the pool has one process per core, and WORKERS=<n> sets the
+# number of processes. The scripts start the pool after their imports, before
+# any other thread exists. Until then, and without WORKERS, everything runs in
+# the calling process. Only
+# the inputs of at least WORKER_MIN_BYTES go to the pool, as sending the smaller
+# ones costs more than decoding them. The workers return marshalled bytes, which
+# are sent back as one string, and loaded much faster than JSON.
+
+WORKERS = os.environ.get("WORKERS", "0")
+WORKER_MIN_BYTES = int(os.environ.get("WORKER_MIN_BYTES", str(256 << 10)))
+
+def ignore_interrupt():
+    # Ctrl-C goes to the whole process group, but only the main process runs the
+    # exit callbacks.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+pool: ProcessPoolExecutor | None = None
+
+def start_pool():
+    """Forks all the processes of the pool, if WORKERS is set. Forking a process
+    which runs several threads can deadlock the children, so the scripts call it
+    from the main thread, after their imports, and before the HTTP clients and
+    the batches start their threads."""
+    global pool
+    workers = (os.cpu_count() or 1) if WORKERS == "auto" else int(WORKERS)
+    if pool is not None or workers <= 0:
+        return
+    # Forked, as spawned processes would run the top level of the scripts again.
+    pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"),
+        initializer=ignore_interrupt)
+    atexit.register(pool.shutdown, cancel_futures=True)
+    # A forked pool starts all its processes with the first job.
+    pool.submit(int).result()
+
+def offloaded(size: int) -> ProcessPoolExecutor | None:
+    """Returns the pool if an input of this size should go to it."""
+    return pool if size >= WORKER_MIN_BYTES else None
+
+def run(pool: ProcessPoolExecutor, func, *args) -> bytes:
+    metrics.count("workers.jobs")
+    with metrics.span(f"workers.{func.__name__}"):
+        return pool.submit(func, *args).result()
+
+async def run_async(pool: ProcessPoolExecutor, func, *args) -> bytes:
+    metrics.count("workers.jobs")
+    with metrics.span(f"workers.{func.__name__}"):
+        return await asyncio.wrap_future(pool.submit(func, *args))
+
+def load_json(data: bytes):
+    """Returns the decoded JSON, from the pool if the data is large."""
+    pool = offloaded(len(data))
+    return json.loads(data) if pool is None else marshal.loads(run(pool, decode_json, data))
+
+async def load_json_async(data: bytes):
+    pool = offloaded(len(data))
+    return json.loads(data) if pool is None else marshal.loads(await run_async(pool, decode_json, data))